@@ -0,0 +1,2 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
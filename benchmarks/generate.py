@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import json
+import random
+from argparse import ArgumentParser
+from itertools import groupby
+from datetime import datetime, timedelta
+from trckr.readwrite import JsonFileRW, BinaryFileRW
+from trckr.database import Entry
+from trckr.columnar import ColumnarEntries
+
+
+BACKENDS = {
+    "struct": {"type": "struct", "data_type": "json"},
+    "struct-v2": {"type": "struct", "data_type": "json", "schema_version": 2},
+    "struct-columnar": {
+        "type": "struct",
+        "data_type": "json",
+        "memory": "columnar"
+    },
+    "struct-columnar-v1": {
+        "type": "struct",
+        "data_type": "json",
+        "memory": "columnar",
+        "schema_version": 1
+    },
+    "struct-rollups": {"type": "struct", "data_type": "json", "rollups": True},
+    "struct-binary": {"type": "struct", "data_type": "binary"},
+    "struct-sharded": {
+        "type": "struct",
+        "data_type": "json",
+        "shards": "month"
+    },
+    "journal": {"type": "struct", "data_type": "journal"},
+    "sqlite": {"type": "sqlite"},
+}
+
+
+class EntrySource:
+    # Migration source decoding the generated entries one at a time.
+    def __init__(self, entries):
+        self.entries = (Entry.from_data(entry) for entry in entries)
+        self.timer = None
+
+
+def generate_entries(
+    count,
+    users=5,
+    contexts=20,
+    notes=200,
+    stop=None,
+    seed=0,
+):
+    # About eight entries per day ending at `stop`, one in twenty long
+    # enough to usually run past midnight.
+    rng = random.Random(seed)
+    stop = datetime.now() if stop is None else stop
+    cursor = stop - timedelta(days=count / 8)
+    for index in range(count):
+        cursor += timedelta(seconds=rng.randint(60, 6 * 3600))
+        duration = timedelta(
+            seconds=(
+                rng.randint(3 * 3600, 10 * 3600)
+                if rng.random() < 0.05
+                else rng.randint(5 * 60, 3 * 3600)
+            )
+        )
+        yield {
+            "id": f"{seed:04x}-{index:012x}",
+            "start": str(cursor),
+            "stop": str(cursor + duration),
+            "meta": {
+                "userid": f"user-{rng.randrange(users)}",
+                "contextid": f"context-{rng.randrange(contexts)}",
+                "note": f"note {rng.randrange(notes)}",
+            }
+        }
+
+
+def _write_json(f, entries):
+    # A version 1 store written one entry at a time, generated entries
+    # are in start order.
+    f.write('{"chronological": true, "entries": [')
+    for index, entry in enumerate(entries):
+        if index > 0:
+            f.write(",")
+        f.write(json.dumps(entry))
+    f.write('], "timer": null}')
+
+
+def _write_shards(path, period, entries):
+    from trckr.sharded_database import PERIODS
+    os.makedirs(path, exist_ok=True)
+    shards = {}
+    for key, shard_entries in groupby(
+        entries,
+        key=lambda entry: (
+            datetime.fromisoformat(entry["start"]).strftime(PERIODS[period])
+        )
+    ):
+        shard_entries = list(shard_entries)
+        JsonFileRW(os.path.join(path, f"{key}.json")).write({
+            "chronological": True,
+            "entries": shard_entries,
+            "timer": None
+        })
+        shards[key] = {
+            "count": len(shard_entries),
+            "max_stop": str(max(
+                datetime.fromisoformat(entry["stop"])
+                for entry in shard_entries
+            )),
+        }
+    JsonFileRW(os.path.join(path, "manifest.json")).write({
+        "period": period,
+        "timer": None,
+        "shards": shards,
+    })
+
+
+def write_store(dbconf, entries):
+    # Entries are streamed into the store, only the binary store holds
+    # them all, as compact columns.
+    if dbconf["type"] == "sqlite":
+        from trckr.sqlite_database import SqliteDatabase
+        SqliteDatabase(dbconf["path"]).migrate(EntrySource(entries))
+    elif dbconf.get("shards") is not None:
+        _write_shards(dbconf["path"], dbconf["shards"], entries)
+    elif dbconf["data_type"] == "binary":
+        columns = ColumnarEntries()
+        for entry in entries:
+            columns.append(entry)
+        BinaryFileRW(dbconf["path"]).write({
+            "entries": columns,
+            "timer": None
+        })
+    elif dbconf["data_type"] == "journal":
+        with open(dbconf["path"], "w") as f:
+            f.write('{"op": "snapshot", "data": ')
+            _write_json(f, entries)
+            f.write("}\n")
+    else:
+        with open(dbconf["path"], "w") as f:
+            _write_json(f, entries)
+
+
+def main(argv):
+    parser = ArgumentParser(
+        description="Write a synthetic trckr json database."
+    )
+    parser.add_argument("path", type=str)
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--contexts", type=int, default=20)
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_store(
+        {"type": "struct", "data_type": "json", "path": args.path},
+        generate_entries(
+            args.entries,
+            users=args.users,
+            contexts=args.contexts,
+            notes=args.notes,
+            seed=args.seed,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
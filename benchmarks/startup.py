@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+from statistics import median
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = {
+    "database": {
+        "data_type": "json",
+        "path": "{CONFIG_DIR}/database.json",
+        "type": "struct"
+    },
+    "defaults": {
+        "contextid": "benchmark",
+        "note": "benchmark",
+        "userid": "{USER}"
+    }
+}
+
+COMMANDS = {
+    "short_track.py s": {
+        "setup": ["short_track.py", "t", "now"],
+        "argv": ["short_track.py", "s"],
+    },
+    "trckr.py list": {
+        "setup": None,
+        "argv": ["trckr.py", "list", "today"],
+    },
+}
+
+
+def _run(argv, env, importtime=False):
+    cmd = [
+        sys.executable,
+        *(["-X", "importtime"] if importtime else []),
+        os.path.join(ROOT, argv[0]),
+        *argv[1:]
+    ]
+    start = time.perf_counter()
+    result = subprocess.run(
+        cmd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    return time.perf_counter() - start, result.stderr.decode("utf-8")
+
+
+def parse_importtime(output):
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        [self_us, cumulative_us, name] = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return modules
+
+
+def measure(name, command, runs, env):
+    timings = []
+    for _ in range(runs):
+        if command["setup"] is not None:
+            _run(command["setup"], env)
+        [elapsed, _] = _run(command["argv"], env)
+        timings.append(elapsed * 1000)
+
+    if command["setup"] is not None:
+        _run(command["setup"], env)
+    [_, importtime] = _run(command["argv"], env, importtime=True)
+    modules = parse_importtime(importtime)
+    return {
+        "command": name,
+        "runs": runs,
+        "wall_ms": {
+            "min": min(timings),
+            "median": median(timings),
+            "max": max(timings),
+        },
+        "import_ms": sum(
+            module["cumulative_ms"]
+            for module in modules
+            if module["depth"] == 0
+        ),
+        "modules": sorted(
+            modules,
+            key=lambda module: module["cumulative_ms"],
+            reverse=True
+        ),
+    }
+
+
+def print_report(results, top):
+    for result in results:
+        wall = result["wall_ms"]
+        print(
+            f"{result['command']}: "
+            f"median {wall['median']:.1f} ms "
+            f"(min {wall['min']:.1f}, max {wall['max']:.1f}, "
+            f"{result['runs']} runs), "
+            f"imports {result['import_ms']:.1f} ms"
+        )
+        for module in result["modules"][:top]:
+            print(
+                f"  {module['cumulative_ms']:8.2f} ms "
+                f"{module['self_ms']:8.2f} ms  "
+                f"{'  ' * module['depth']}{module['module']}"
+            )
+
+
+def main(argv):
+    parser = ArgumentParser(
+        description="Measure cold start time of the trckr entry points."
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="number of modules to show per command"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="write results as json"
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        config_path = os.path.join(workdir, ".trckr.json")
+        with open(config_path, "w") as f:
+            json.dump(CONFIG, f)
+        env = {
+            **os.environ,
+            "TRCKR_CONFIG": config_path,
+            "XDG_CACHE_HOME": os.path.join(workdir, "cache"),
+        }
+        results = [
+            measure(name, command, args.runs, env)
+            for name, command in COMMANDS.items()
+        ]
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_report(results, args.top)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,144 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import glob
+import tempfile
+import multiprocessing
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from trckr import app
+from trckr.database import Meta
+from . import generate
+
+
+BACKENDS = {
+    **generate.BACKENDS,
+    # Compact often so snapshots race with appends.
+    "journal": {**generate.BACKENDS["journal"], "compact_after": 7},
+}
+
+
+def worker(config, worker_id, count):
+    # Every iteration loads and commits on its own, like a separate `st a`
+    # fired from a git hook.
+    meta = Meta(
+        userid=f"user-{worker_id}",
+        contextid="stress",
+        note=f"worker-{worker_id}"
+    )
+    start = datetime(2022, 1, 1) + timedelta(days=worker_id)
+    for index in range(count):
+        database = app.load_database(config)
+        database.add(
+            start + timedelta(minutes=index),
+            start + timedelta(minutes=index + 1),
+            meta
+        )
+        database.commit()
+
+
+def stress(name, dbconf, workers, count, workdir):
+    path = os.path.join(workdir, f"{name}.db")
+    config = {"database": {**dbconf, "path": path}}
+    processes = [
+        multiprocessing.Process(target=worker, args=(config, index, count))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    failures = [
+        f"worker exited with {process.exitcode}"
+        for process in processes
+        if process.exitcode != 0
+    ]
+    entries = app.load_database(config).entries
+    if len(entries) != workers * count:
+        failures.append(
+            f"expected {workers * count} entries, found {len(entries)}"
+        )
+    for index in range(workers):
+        found = sum(
+            1 for entry in entries if entry.meta.userid == f"user-{index}"
+        )
+        if found != count:
+            failures.append(f"user-{index}: {found} of {count} entries")
+    leftovers = glob.glob(f"{path}.*.tmp")
+    if len(leftovers) > 0:
+        failures.append(f"temporary files left behind: {leftovers}")
+    return failures
+
+
+def torn_journal(workdir):
+    # An append interrupted mid record leaves a torn last line, later
+    # appends must not be glued onto it.
+    path = os.path.join(workdir, "torn.journal")
+    config = {"database": {**BACKENDS["journal"], "path": path}}
+    meta = Meta(userid="user-0", contextid="stress", note="torn")
+    start = datetime(2022, 1, 1)
+    failures = []
+    for index in range(3):
+        if index == 1:
+            with open(path, "a") as f:
+                f.write('{"op": "tor')
+        database = app.load_database(config)
+        database.add(
+            start + timedelta(minutes=index),
+            start + timedelta(minutes=index + 1),
+            meta
+        )
+        database.commit()
+    try:
+        found = len(app.load_database(config).entries)
+    except ValueError as e:
+        return [f"unreadable after a torn append: {e}"]
+    if found != 3:
+        failures.append(f"expected 3 entries after a torn append: {found}")
+    return failures
+
+
+def main(argv):
+    parser = ArgumentParser(
+        description="Commit from many processes at once and check that no "
+        "update is lost."
+    )
+    parser.add_argument(
+        "--backends",
+        type=str,
+        default=",".join(BACKENDS.keys()),
+        help=f"comma separated subset of {', '.join(BACKENDS.keys())}"
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--count", type=int, default=25)
+    args = parser.parse_args(argv)
+
+    failed = False
+
+    def _report(name, failures):
+        status = "ok" if len(failures) == 0 else "FAILED"
+        print(f"{name}: {status}")
+        for failure in failures:
+            print(f"  {failure}")
+        return len(failures) > 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.backends.split(","):
+            failures = stress(
+                name,
+                BACKENDS[name],
+                args.workers,
+                args.count,
+                workdir
+            )
+            failed = _report(name, failures) or failed
+        failures = torn_journal(workdir)
+        failed = _report("journal-torn-append", failures) or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,250 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from statistics import median
+from trckr import app
+from trckr.database import Meta
+from .generate import BACKENDS, generate_entries, write_store
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LIST_FORMATS = ["list", "json", "yaml", "ndjson", "totals"]
+
+
+def measure(fn, runs, setup=None):
+    timings = []
+    for _ in range(runs):
+        state = None if setup is None else setup()
+        started = time.perf_counter()
+        fn(state)
+        timings.append(time.perf_counter() - started)
+    return {
+        "runs": runs,
+        "min": min(timings),
+        "median": median(timings),
+        "max": max(timings),
+    }
+
+
+def ranges(now):
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "day": [day, day + timedelta(days=1)],
+        "week": [day - timedelta(days=6), day + timedelta(days=1)],
+        "month": [day - timedelta(days=29), day + timedelta(days=1)],
+        "all": [None, None],
+    }
+
+
+def bench_database(name, dbconf, size, args, workdir):
+    now = datetime.now()
+    path = os.path.join(workdir, f"{name}-{size}.db")
+    config = {"database": {**dbconf, "path": path}}
+    write_store(
+        config["database"],
+        generate_entries(
+            size,
+            users=args.users,
+            contexts=args.contexts,
+            notes=args.notes,
+            stop=now,
+        )
+    )
+    # Let backends persist derived data such as rollups before timing.
+    app.load_database(config).commit()
+
+    meta = Meta(userid="user-0", contextid="context-0", note="benchmark")
+    results = {}
+
+    def _load(_):
+        return app.load_database(config)
+
+    results["load_database"] = measure(_load, args.runs)
+
+    def _timed_write(write, prepare=None):
+        def _setup():
+            db = _load(None)
+            if prepare is not None:
+                prepare(db)
+                db.commit()
+            return db
+
+        def _run(db):
+            write(db)
+            db.commit()
+        return measure(_run, args.runs, setup=_setup)
+
+    results["add"] = _timed_write(
+        lambda db: db.add(now - timedelta(hours=2), now, meta)
+    )
+    results["start"] = _timed_write(
+        lambda db: db.start(now, meta)
+    )
+    results["stop"] = _timed_write(
+        lambda db: db.stop(now + timedelta(minutes=1)),
+        prepare=lambda db: db.start(now, meta)
+    )
+
+    db = _load(None)
+    for range_name, [from_time, to_time] in ranges(now).items():
+        results[f"select_{range_name}"] = measure(
+            lambda _: sum(1 for _ in db.select(from_time, to_time)),
+            args.runs
+        )
+        entries = list(db.select(from_time, to_time))
+        results[f"group_summary_{range_name}"] = measure(
+            lambda _: list(app.group_summary(entries)),
+            args.runs
+        )
+
+    [from_time, to_time] = ranges(now)["month"]
+    for list_format in LIST_FORMATS:
+        def _list(_):
+            with redirect_stdout(io.StringIO()):
+                app.list_entries(db, [from_time, to_time], list_format)
+        results[f"list_{list_format}_month"] = measure(_list, args.runs)
+
+    # A whole `st l` run from loading the store, with and without the result
+    # cache. The first cached run fills the cache.
+    command_config = {**config, "defaults": asdict(meta)}
+    command = {
+        "type": "list",
+        "format": "list",
+        "interval": [from_time, to_time],
+        "filters": {},
+    }
+    for operation, result_cache in [
+        ("list_command_month", False),
+        ("list_command_cached_month", True),
+    ]:
+        def _command(_):
+            with redirect_stdout(io.StringIO()):
+                app.exec(
+                    command_config,
+                    app.load_database_for(command_config, command),
+                    command,
+                    result_cache
+                )
+        results[operation] = measure(_command, args.runs)
+
+    return [
+        {
+            "backend": name,
+            "entries": size,
+            "operation": operation,
+            "seconds": timing,
+        }
+        for operation, timing in results.items()
+    ]
+
+
+def bench_config(args, workdir):
+    config_path = os.path.join(workdir, ".trckr.json")
+    with open(config_path, "w") as f:
+        json.dump({
+            "gitdir": os.path.join(ROOT, ".git"),
+            "database": {
+                "data_type": "json",
+                "path": "{HOME}/.trckr-{GITNAME}",
+                "type": "struct"
+            },
+            "defaults": {
+                "contextid": "{GITNAME}",
+                "note": "{GITNAME}-{GITBRANCH}",
+                "userid": "{USER}"
+            }
+        }, f)
+    os.environ["XDG_CACHE_HOME"] = os.path.join(workdir, "cache")
+    return [
+        {
+            "backend": None,
+            "entries": None,
+            "operation": operation,
+            "seconds": measure(
+                lambda _: app.load_config(config_path, use_cache=use_cache),
+                args.runs
+            ),
+        }
+        for operation, use_cache in [
+            ("load_config", False),
+            ("load_config_cached", True),
+        ]
+    ]
+
+
+def trckr_version():
+    try:
+        return subprocess.check_output(
+            ["git", "-C", ROOT, "describe", "--always", "--dirty"],
+            stderr=subprocess.DEVNULL
+        ).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv):
+    parser = ArgumentParser(
+        description="Time trckr operations on synthetic databases."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=str,
+        default="1000,10000,100000",
+        help="comma separated entry counts, e.g. 1000,10000000"
+    )
+    parser.add_argument(
+        "--backends",
+        type=str,
+        default=",".join(BACKENDS.keys()),
+        help=f"comma separated subset of {', '.join(BACKENDS.keys())}"
+    )
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--contexts", type=int, default=20)
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="file to write json results to instead of stdout"
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        results.extend(bench_config(args, workdir))
+        for size in [int(size) for size in args.sizes.split(",")]:
+            for name in args.backends.split(","):
+                print(f"{name}: {size} entries", file=sys.stderr)
+                results.extend(
+                    bench_database(name, BACKENDS[name], size, args, workdir)
+                )
+
+    report = {
+        "version": trckr_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": str(datetime.now()),
+        "results": results,
+    }
+    if args.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -2,20 +2,37 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import sys
-from trckr import app, cli
+from trckr import app, cli, daemon, profile
 from trckr.exceptions import TrckrError
 from trckr.cli.utils import CLIParseError
 
 
 if __name__ == "__main__":
     try:
-        config = app.load_config(cli.utils.DEFAULT_CONFIG_PATH)
-        database = app.load_database(config)
-        command = cli.short.parse_args(sys.argv[1:])
-        app.exec(
-            config,
-            database,
-            command
+        options, argv = cli.short.parse_options(sys.argv[1:])
+        profile_output = cli.utils.parse_profile_output(
+            options.get("profile", cli.utils.DEFAULT_PROFILE)
         )
+        if profile_output is not None:
+            profile.enable(profile_output)
+        config = app.load_config(
+            cli.utils.DEFAULT_CONFIG_PATH,
+            use_cache=options.get(
+                "config_cache",
+                cli.utils.DEFAULT_CONFIG_CACHE
+            )
+        )
+        command = cli.short.parse_args(argv)
+        try:
+            print(daemon.request(config, command), end="")
+        except daemon.DaemonUnavailable:
+            database = app.load_database_for(config, command)
+            app.exec(
+                config,
+                database,
+                command
+            )
     except (CLIParseError, TrckrError) as e:
         print(str(e))
+    finally:
+        profile.report()
@@ -2,7 +2,7 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import sys
-from trckr import app, cli
+from trckr import app, cli, daemon, profile
 from trckr.exceptions import TrckrError
 from trckr.cli.utils import CLIParseError
 
@@ -13,13 +13,29 @@ if __name__ == "__main__":
             sys.argv[1:],
             cli.utils.DEFAULT_CONFIG_PATH
         )
-        config = app.load_config(args["config_path"])
-        command = cli.cli.args_to_command(config, **args)
-        database = app.load_database(config)
-        app.exec(
-            config,
-            database,
-            command
+        profile_output = cli.utils.parse_profile_output(
+            args["profile"] or cli.utils.DEFAULT_PROFILE
+        )
+        if profile_output is not None:
+            profile.enable(profile_output)
+        config = app.load_config(
+            args["config_path"],
+            use_cache=(
+                args["config_cache"]
+                and cli.utils.DEFAULT_CONFIG_CACHE
+            )
         )
+        command = cli.cli.args_to_command(config, **args)
+        try:
+            print(daemon.request(config, command), end="")
+        except daemon.DaemonUnavailable:
+            database = app.load_database_for(config, command)
+            app.exec(
+                config,
+                database,
+                command
+            )
     except (CLIParseError, TrckrError) as e:
         print(str(e))
+    finally:
+        profile.report()
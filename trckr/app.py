@@ -1,23 +1,30 @@
 # SPDX-FileCopyrightText: 2022 Mattias Nyberg
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import os
+import sys
 import datetime
-import yaml
-import json
-from itertools import groupby
+from contextlib import contextmanager
 from .data_extensions import standard_extensions
 from .utils import (
     first_database,
     database_loaders,
+    reader_loaders,
+    database_configs,
     config_from_json,
     writable_config,
     insert_into_struct,
     hours_and_minutes,
 )
+from .config_cache import cached_config
 from .database import Meta
+from .profile import span, profiled_database
 from .exceptions import TrckrError
 
 
+READ_ONLY_COMMANDS = ["list", "export", "check-overlaps"]
+
+
 def add_entry(db, interval, note=None):
     [from_time, to_time] = interval
     db.add(from_time, to_time, note)
@@ -34,32 +41,259 @@ def stop_timer(db, time):
     db.commit()
 
 
-def list_entries(db, interval=[None, None], format="list"):
+def import_entries(db, path, format, defaults, batch_size=None):
+    import time
+    from itertools import islice
+    from .transfer import read_entries
+
+    rejected = []
+    imported = 0
+    started = time.perf_counter()
+    try:
+        with open(path, "r", newline="") as f:
+            entries = read_entries(f, format, defaults, rejected)
+            while True:
+                batch = (
+                    entries
+                    if batch_size is None
+                    else islice(entries, batch_size)
+                )
+                count = db.add_many(batch)
+                if count == 0:
+                    break
+                imported += count
+                db.commit()
+    except FileNotFoundError:
+        raise TrckrError(f"Import file not found: {path}")
+    elapsed = time.perf_counter() - started
+
+    for line_number, reason in rejected:
+        print(f"Rejected line {line_number}: {reason}")
+    print(
+        f"Imported {imported} entries in {elapsed:.2f}s "
+        f"({imported / elapsed if elapsed > 0 else 0:.0f} rows/s), "
+        f"rejected {len(rejected)}"
+    )
+
+
+def export_entries(db, interval=[None, None], format="jsonl", path=None):
+    from .transfer import entry_writers
     [from_time, to_time] = interval
     entries = db.select(
         from_time=from_time,
         to_time=to_time
     )
+    try:
+        write = entry_writers[format]
+    except KeyError:
+        raise TrckrError(f"Unknown export format: {format}")
+
+    if path is None:
+        with closed_stdout_allowed():
+            write(sys.stdout, entries)
+    else:
+        with open(path, "w", newline="") as f:
+            write(f, entries)
+
 
-    formats = {
+def list_entries(
+    db,
+    interval=[None, None],
+    format="list",
+    filters={},
+    group_by=None,
+    sort="key",
+    merge_overlaps=False
+):
+    [from_time, to_time] = interval
+    if merge_overlaps:
+        from .overlaps import MergedOverlapsDatabase
+        db = MergedOverlapsDatabase(db)
+    if group_by is not None:
+        list_report(db, interval, format, filters, group_by, sort)
+        return
+    if format == "totals":
+        print_totals(db.totals(from_time, to_time, **filters))
+        return
+
+    entries = db.select(
+        from_time=from_time,
+        to_time=to_time,
+        **filters
+    )
+
+    group_formats = {
         "list": print_groups_as_simplified_yaml,
         "json": print_groups_as_json,
         "yaml": print_groups_as_yaml
     }
+    entry_formats = {
+        "ndjson": print_entries_as_ndjson
+    }
+
+    if format in entry_formats:
+        entry_formats[format](entries)
+    else:
+        groups = list(group_summary(entries))
+        group_formats[format](groups)
+
+
+def list_entries_cached(config, db, command, use_cache=True):
+    from . import result_cache
+
+    def _render():
+        list_entries(
+            db,
+            command["interval"],
+            command["format"],
+            command.get("filters", {}),
+            command.get("group_by"),
+            command.get("sort", "key"),
+            command.get("merge_overlaps", False)
+        )
+
+    if not (use_cache and result_cache.DEFAULT_RESULT_CACHE):
+        _render()
+        return
+    with span("result_cache"):
+        key = result_cache.cache_key(config, command)
+    result_cache.cached_output(key, _render)
+
+
+def list_report(db, interval, format, filters, group_by, sort="key"):
+    from .report import build_report, format_report
+    [from_time, to_time] = interval
+    report_formats = {
+        "list": print_report_as_simplified_yaml,
+        "totals": print_report_as_simplified_yaml,
+        "json": lambda report: print_groups_as_json(format_report(report)),
+        "yaml": lambda report: print_groups_as_yaml(format_report(report)),
+        "ndjson": print_report_as_ndjson,
+    }
+    try:
+        print_report = report_formats[format]
+    except KeyError:
+        raise TrckrError(f"Unknown list format: {format}")
+    report = build_report(
+        db.aggregate(from_time, to_time, group_by, **filters),
+        group_by,
+        sort
+    )
+    print_report(report)
+
+
+def print_report_as_simplified_yaml(report, timeformat="%02dh %02dm"):
+    import yaml
+
+    def _simplified(groups):
+        return {
+            (
+                f"{group['id']} <- {timeformat % hours_and_minutes(time)}"
+                if "groups" in group
+                else str(group["id"])
+            ): (
+                _simplified(group["groups"])
+                if "groups" in group
+                else timeformat % hours_and_minutes(time)
+            )
+            for group in groups
+            for time in [group["duration"]]
+        }
+
+    total = timeformat % hours_and_minutes(report["duration"])
+    print(yaml.safe_dump(
+        {f"total <- {total}": _simplified(report["groups"])},
+        sort_keys=False
+    ))
+
+
+def print_report_as_ndjson(report):
+    import json
+    from .report import report_lines
+    with closed_stdout_allowed():
+        for line in report_lines(report):
+            print(json.dumps(line))
+
+
+def check_overlaps(db, interval=[None, None], format="list"):
+    from .overlaps import overlap_report
+    [from_time, to_time] = interval
+    overlap_formats = {
+        "list": print_overlaps_as_simplified_yaml,
+        "json": lambda report: print_groups_as_json(overlap_summary(report)),
+        "yaml": lambda report: print_groups_as_yaml(overlap_summary(report)),
+    }
+    try:
+        print_overlaps = overlap_formats[format]
+    except KeyError:
+        raise TrckrError(f"Unknown overlap format: {format}")
+    print_overlaps(overlap_report(db, from_time, to_time))
+
+
+def overlap_summary(report, timeformat="%02dh %02dm"):
+    def _entry(entry):
+        return {
+            "id": entry.id,
+            "start": str(entry.start),
+            "stop": (
+                None
+                if entry.id == report["timer"]
+                else str(entry.stop)
+            ),
+            "contextid": entry.meta.contextid,
+            "note": entry.meta.note,
+        }
+
+    return {
+        "overlaps": [
+            {
+                "userid": first.meta.userid,
+                "start": str(start),
+                "stop": str(stop),
+                "time": timeformat % hours_and_minutes(stop - start),
+                "entries": [_entry(first), _entry(second)],
+            }
+            for [first, second, start, stop] in report["overlaps"]
+        ],
+        "double_counted": {
+            userid: timeformat % hours_and_minutes(time)
+            for userid, time in report["double_counted"].items()
+        },
+    }
+
 
-    groups = list(group_summary(entries))
-    formats[format](groups)
+def print_overlaps_as_simplified_yaml(report):
+    import yaml
+    summary = overlap_summary(report)
+    users = {}
+    for overlap in summary["overlaps"]:
+        userid = overlap["userid"]
+        key = (
+            f"{userid} <- {summary['double_counted'].get(userid, '-')}"
+            " double counted"
+        )
+        users.setdefault(key, {})[
+            f"{overlap['start']} - {overlap['stop']} <- {overlap['time']}"
+        ] = [
+            f"{entry['contextid']} {entry['start']} - "
+            f"{entry['stop'] or 'running'}: {entry['note']}"
+            for entry in overlap["entries"]
+        ]
+    print(yaml.safe_dump(users, sort_keys=False))
 
 
 def print_groups_as_json(groups):
+    import json
     print(json.dumps(groups, indent=4))
 
 
 def print_groups_as_yaml(groups):
+    import yaml
     print(yaml.safe_dump(groups))
 
 
 def print_groups_as_simplified_yaml(groups):
+    import yaml
     simplified = {
         f"{group['id']} <- {group['time']}": {
             f"{entry['date']} <- {entry['time']}": entry["note"]
@@ -70,28 +304,80 @@ def print_groups_as_simplified_yaml(groups):
     print(yaml.safe_dump(simplified))
 
 
+@contextmanager
+def closed_stdout_allowed():
+    try:
+        yield
+    except BrokenPipeError:
+        # The reader went away, e.g. `st l - ndjson | head`.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+
+
+def print_entries_as_ndjson(entries, timeformat="%02dh %02dm"):
+    import json
+    # Entries stream in time order, contexts interleave, so the group totals
+    # follow once every entry is out.
+    groupsums = {}
+    with closed_stdout_allowed():
+        for entry in entries:
+            contextid = entry.meta.contextid
+            groupsums[contextid] = (
+                groupsums.get(contextid, datetime.timedelta()) + entry.duration
+            )
+            print(json.dumps({
+                "type": "entry",
+                "id": contextid,
+                **entry_summary(entry, timeformat)
+            }))
+        for contextid, groupsum in groupsums.items():
+            print(json.dumps({
+                "type": "group",
+                "id": contextid,
+                "time": timeformat % hours_and_minutes(groupsum)
+            }))
+
+
+def print_totals(totals, timeformat="%02dh %02dm"):
+    import yaml
+    contexts = {}
+    for (userid, contextid), time in totals.items():
+        contexts[contextid] = contexts.get(
+            contextid,
+            datetime.timedelta()
+        ) + time
+    print(yaml.safe_dump({
+        contextid: timeformat % hours_and_minutes(time)
+        for contextid, time in contexts.items()
+    }))
+
+
+def entry_summary(entry, timeformat="%02dh %02dm"):
+    return {
+        "date": str(entry.start.date()),
+        "time": timeformat % (
+            hours_and_minutes(entry.duration)
+        ),
+        "note": entry.meta.note
+    }
+
+
 def group_summary(entries, timeformat="%02dh %02dm"):
-    grouped_entries = groupby(
-        entries,
-        key=lambda e: e.meta.contextid
-    )
-    for contextid, group_entries in grouped_entries:
-        entry_list = list(group_entries)
+    # Hash grouping in first seen order, select() output is ordered by time
+    # so the entries of a context are not necessarily adjacent.
+    grouped_entries = {}
+    for entry in entries:
+        grouped_entries.setdefault(entry.meta.contextid, []).append(entry)
+    for contextid, entry_list in grouped_entries.items():
         groupsum = sum(
-            [entry.stop - entry.start for entry in entry_list],
+            [entry.duration for entry in entry_list],
             datetime.timedelta()
         )
         yield {
             "id": contextid,
             "time": timeformat % hours_and_minutes(groupsum),
             "entries": [
-                {
-                    "date": str(entry.start.date()),
-                    "time": timeformat % (
-                        hours_and_minutes(entry.stop - entry.start)
-                    ),
-                    "note": entry.meta.note
-                }
+                entry_summary(entry, timeformat)
                 for entry in entry_list
             ]
         }
@@ -103,31 +389,99 @@ def set_property(config_path, property, value):
         insert_into_struct(config, path, value)
 
 
-def load_config(config_path):
-    return config_from_json(
-        config_path,
-        standard_extensions
-    )
+def load_config(config_path, use_cache=True):
+    with span("load_config"):
+        if use_cache:
+            return cached_config(
+                config_path,
+                standard_extensions
+            )
+        return config_from_json(
+            config_path,
+            standard_extensions
+        )
 
 
 def load_database(
     config,
     database_loader=first_database(database_loaders)
 ):
-    return database_loader(config)
+    with span("load_database"):
+        return profiled_database(database_loader(config))
+
+
+def load_reader(
+    config,
+    database_loader=first_database(reader_loaders)
+):
+    return load_database(config, database_loader)
+
+
+def load_databases(config):
+    from .federated import FederatedDatabase
+    with span("load_databases"):
+        return profiled_database(
+            FederatedDatabase(database_configs(config))
+        )
+
+
+class _LazyDatabase:
+    # Loads the database on first use, so a cached list result is printed
+    # without reading the store.
+    def __init__(self, load):
+        self._load = load
+        self._database = None
+
+    def __getattr__(self, name):
+        if self._database is None:
+            self._database = self._load()
+        return getattr(self._database, name)
+
 
+def load_database_for(config, command):
+    if command.get("type") == "list":
+        return _LazyDatabase(lambda: _load_database_for(config, command))
+    return _load_database_for(config, command)
 
-def exec(config, database, command):
-    defaults = config.get("defaults", {})
-    meta = Meta.from_data({
-        **defaults,
+
+def _load_database_for(config, command):
+    if command.get("all_dbs", False):
+        return load_databases(config)
+    if command.get("type") in READ_ONLY_COMMANDS:
+        return load_reader(config)
+    return load_database(config)
+
+
+def exec(config, database, command, result_cache=True):
+    defaults = {
+        **config.get("defaults", {}),
         **command.get("meta", {})
-    })
+    }
+    meta = Meta.from_data(defaults)
     tracker_cmds = {
         "add": lambda db: add_entry(db, command["interval"], meta),
         "start": lambda db: start_timer(db, command["time"], meta),
         "stop": lambda db: stop_timer(db, command["time"]),
-        "list": lambda db: list_entries(
+        "import": lambda db: import_entries(
+            db,
+            command["path"],
+            command["format"],
+            defaults,
+            command.get("batch_size")
+        ),
+        "export": lambda db: export_entries(
+            db,
+            command["interval"],
+            command["format"],
+            command.get("path")
+        ),
+        "list": lambda db: list_entries_cached(
+            config,
+            db,
+            command,
+            result_cache
+        ),
+        "check-overlaps": lambda db: check_overlaps(
             db,
             command["interval"],
             command["format"]
@@ -138,8 +492,10 @@ def exec(config, database, command):
             command["value"]
         ),
     }
+    command_type = command.get("type")
     try:
-        command_type = command["type"]
-        tracker_cmds[command_type](database)
+        tracker_cmd = tracker_cmds[command_type]
     except KeyError:
         raise TrckrError(f"Command type not found: {command_type}")
+    with span(f"exec.{command_type}"):
+        tracker_cmd(database)
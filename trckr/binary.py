@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+import json
+import struct
+from array import array
+from .columnar import ColumnarEntries, StringColumn
+from .exceptions import TrckrError
+
+
+# Layout: MAGIC, format version, then length prefixed sections. The first
+# section is a json header with the string tables and every top level key
+# except the entries. It is followed by the entry columns: start and stop
+# as int64 epoch microseconds, one uint32 string table code per meta field
+# and the ids joined by NUL.
+MAGIC = b"TRCKRBIN"
+VERSION = 1
+_HEADER = struct.Struct("<8sI")
+_LENGTH = struct.Struct("<Q")
+
+
+def is_binary(prefix: bytes) -> bool:
+    return prefix.startswith(MAGIC)
+
+
+def _array_bytes(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _array_from(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def dumps(data) -> bytes:
+    entries = data.get("entries", [])
+    if not isinstance(entries, ColumnarEntries):
+        entries = ColumnarEntries(entries)
+    [starts, stops, ids, userids, contextids, notes] = entries.columns()
+    header = {
+        "count": len(entries),
+        "data": {
+            key: value
+            for key, value in data.items()
+            if key != "entries"
+        },
+        "userids": userids.values,
+        "contextids": contextids.values,
+        "notes": notes.values,
+    }
+    sections = [
+        json.dumps(header, separators=(",", ":")).encode("utf-8"),
+        _array_bytes(starts),
+        _array_bytes(stops),
+        _array_bytes(userids.codes),
+        _array_bytes(contextids.codes),
+        _array_bytes(notes.codes),
+        "\0".join(ids).encode("utf-8"),
+    ]
+    return b"".join([
+        _HEADER.pack(MAGIC, VERSION),
+        *(
+            part
+            for section in sections
+            for part in [_LENGTH.pack(len(section)), section]
+        ),
+    ])
+
+
+def _sections(buffer):
+    offset = _HEADER.size
+    while offset < len(buffer):
+        [length] = _LENGTH.unpack_from(buffer, offset)
+        offset += _LENGTH.size
+        yield buffer[offset:offset + length]
+        offset += length
+
+
+def loads(buffer: bytes):
+    [magic, version] = _HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise TrckrError("Not a binary trckr database")
+    if version != VERSION:
+        raise TrckrError(f"Unsupported binary database version: {version}")
+    [
+        header,
+        starts,
+        stops,
+        userids,
+        contextids,
+        notes,
+        ids,
+    ] = _sections(memoryview(buffer))
+    header = json.loads(bytes(header))
+    count = header["count"]
+    return {
+        **header["data"],
+        "entries": ColumnarEntries.from_columns(
+            starts=_array_from("q", starts),
+            stops=_array_from("q", stops),
+            ids=str(ids, "utf-8").split("\0") if count > 0 else [],
+            userids=StringColumn(
+                header["userids"],
+                _array_from("I", userids)
+            ),
+            contextids=StringColumn(
+                header["contextids"],
+                _array_from("I", contextids)
+            ),
+            notes=StringColumn(header["notes"], _array_from("I", notes)),
+        )
+    }
+
+
+def json_to_binary(json_path, binary_path):
+    from .readwrite import JsonFileRW, BinaryFileRW
+    from .schema import schema_version, decode_columnar
+    data = JsonFileRW(json_path).read()
+    if data is None:
+        raise TrckrError(f"Database not found: {json_path}")
+    if schema_version(data) != 1:
+        data = decode_columnar(data)
+    BinaryFileRW(binary_path).write(data)
+
+
+def binary_to_json(binary_path, json_path):
+    from .readwrite import JsonFileRW, BinaryFileRW
+    data = BinaryFileRW(binary_path).read()
+    if data is None:
+        raise TrckrError(f"Database not found: {binary_path}")
+    JsonFileRW(json_path).write({
+        **data,
+        "entries": data["entries"].to_data()
+    })
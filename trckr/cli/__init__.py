@@ -1,11 +1,17 @@
 # SPDX-FileCopyrightText: 2022 Mattias Nyberg
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from . import (
-    cli,
-    short,
-    utils
-)
+import importlib
+
+# Submodules are imported on first access so the short form does not pay
+# for argparse and the long form does not pay for the short parser.
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = (
     'cli',
@@ -9,6 +9,9 @@ from .utils import (
     parse_stop,
     parse_add,
     parse_list,
+    parse_import,
+    parse_export,
+    parse_check_overlaps,
     parse_time
 )
 
@@ -27,6 +30,25 @@ def parse_args(
         default=default_config_path,
         help="path to config file"
     )
+    parser.add_argument(
+        "--no-config-cache",
+        dest="config_cache",
+        action="store_false",
+        help="resolve the config without using the config cache"
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_const",
+        const="-",
+        help="print a timing breakdown to stderr"
+    )
+    parser.add_argument(
+        "--profile-file",
+        dest="profile",
+        type=str,
+        help="append a timing breakdown as json lines to a file"
+    )
     parser.add_argument(
         "--context",
         dest="contextid",
@@ -118,12 +140,107 @@ def parse_args(
     list_parse.add_argument(
         "--format",
         type=str,
-        help="output format"
+        help="output format: list, json, yaml, ndjson or totals"
+    )
+    list_parse.add_argument(
+        "--note",
+        dest="note_prefix",
+        type=str,
+        help="only list entries with a note starting with this prefix"
+    )
+    list_parse.add_argument(
+        "--all-dbs",
+        dest="all_dbs",
+        action="store_true",
+        help="list entries from every store in the databases config"
+    )
+    list_parse.add_argument(
+        "--group-by",
+        dest="group_by",
+        type=str,
+        help="report totals grouped by a comma separated list of:"
+        " user, context, note, day, week and month"
+    )
+    list_parse.add_argument(
+        "--sort",
+        choices=["key", "time"],
+        help="order report groups by key or by most time first"
+    )
+    list_parse.add_argument(
+        "--merge-overlaps",
+        dest="merge_overlaps",
+        action="store_true",
+        help="count time covered by overlapping entries of a user once"
     )
     list_parse.set_defaults(
         command="list"
     )
 
+    import_parse = subparsers.add_parser(
+        "import",
+        help="import entries from a csv or jsonl file, times with a utc"
+        " offset are converted to local time"
+    )
+    import_parse.add_argument(
+        "file",
+        type=str,
+        help="file to import"
+    )
+    import_parse.add_argument(
+        "--format",
+        type=str,
+        help="file format: csv or jsonl, guessed from the file name"
+    )
+    import_parse.add_argument(
+        "--batch-size",
+        type=int,
+        help="commit after this many entries instead of once at the end"
+    )
+    import_parse.set_defaults(
+        command="import"
+    )
+
+    export_parse = subparsers.add_parser(
+        "export",
+        help="export entries as csv or jsonl"
+    )
+    export_parse.add_argument(
+        "interval",
+        type=str,
+        help="interval to export"
+    )
+    export_parse.add_argument(
+        "--format",
+        type=str,
+        help="output format: csv or jsonl"
+    )
+    export_parse.add_argument(
+        "--output",
+        type=str,
+        help="file to write to instead of stdout"
+    )
+    export_parse.set_defaults(
+        command="export"
+    )
+
+    check_overlaps_parse = subparsers.add_parser(
+        "check-overlaps",
+        help="report entries of a user that overlap in time"
+    )
+    check_overlaps_parse.add_argument(
+        "interval",
+        type=str,
+        help="interval to check"
+    )
+    check_overlaps_parse.add_argument(
+        "--format",
+        type=str,
+        help="output format: list, json or yaml"
+    )
+    check_overlaps_parse.set_defaults(
+        command="check-overlaps"
+    )
+
     init_parse = subparsers.add_parser(
         "init",
         help="initialize a new trckr"
@@ -158,7 +275,13 @@ def parse_args(
     return vars(args)
 
 
-def args_to_command(config, command, **kargs):
+def args_to_command(
+    config,
+    command,
+    config_cache=True,
+    profile=None,
+    **kargs
+):
     args = {
         **config.get("defaults", {}),
         **{
@@ -189,7 +312,35 @@ def args_to_command(config, command, **kargs):
     elif command == "stop":
         return parse_stop(args.get("to"))
     elif command == "list":
+        # Only explicitly given ids filter the list, not the defaults.
         return parse_list(
+            args.get("interval", "-"),
+            args.get("format", "list"),
+            {
+                key: kargs[key]
+                for key in ["userid", "contextid", "note_prefix"]
+                if kargs.get(key) is not None
+            },
+            args.get("all_dbs", False),
+            args.get("group_by"),
+            args.get("sort"),
+            args.get("merge_overlaps", False)
+        )
+    elif command == "import":
+        return parse_import(
+            args["file"],
+            args.get("format"),
+            args.get("batch_size"),
+            meta
+        )
+    elif command == "export":
+        return parse_export(
+            args.get("interval", "-"),
+            args.get("format", "jsonl"),
+            args.get("output")
+        )
+    elif command == "check-overlaps":
+        return parse_check_overlaps(
             args.get("interval", "-"),
             args.get("format", "list")
         )
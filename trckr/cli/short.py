@@ -7,6 +7,10 @@ from .utils import (
     parse_stop,
     parse_add,
     parse_list,
+    parse_filters,
+    parse_import,
+    parse_export,
+    parse_check_overlaps,
     parse_config_property,
     parse_time
 )
@@ -36,10 +40,55 @@ def cmd_add(argv):
 
 
 def cmd_list(argv):
-    """List the time entries in interval: (interval) (list|json|yaml)"""
+    """List the time entries in interval: (interval)
+      (list|json|yaml|ndjson|totals)
+      ([user=<id>] [context=<id>] [note=<prefix>])
+      ([by=<dimension,...>] [sort=key|time])
+      (--all-dbs) (--merge-overlaps)"""
+    report_options = {
+        key: value
+        for [key, _, value] in (item.partition("=") for item in argv[2:])
+        if key in ["by", "sort"]
+    }
     return parse_list(
         intervalstr=argv[0] if len(argv) > 0 and argv[0] != "-" else None,
-        list_format=argv[1] if len(argv) > 1 else "list"
+        list_format=argv[1] if len(argv) > 1 and argv[1] != "-" else "list",
+        filters=parse_filters([
+            item
+            for item in argv[2:]
+            if item not in ["--all-dbs", "--merge-overlaps"]
+            and item.partition("=")[0] not in report_options
+        ]),
+        all_dbs="--all-dbs" in argv[2:],
+        group_by=report_options.get("by"),
+        sort=report_options.get("sort"),
+        merge_overlaps="--merge-overlaps" in argv[2:]
+    )
+
+
+def cmd_check_overlaps(argv):
+    """Report overlapping entries in interval: (interval) (list|json|yaml)"""
+    return parse_check_overlaps(
+        intervalstr=argv[0] if len(argv) > 0 and argv[0] != "-" else None,
+        check_format=argv[1] if len(argv) > 1 and argv[1] != "-" else "list"
+    )
+
+
+def cmd_import(argv):
+    """Import entries from a file: <file> (csv|jsonl) (batch size)"""
+    return parse_import(
+        path=argv[0],
+        import_format=argv[1] if len(argv) > 1 and argv[1] != "-" else None,
+        batch_size=argv[2] if len(argv) > 2 else None
+    )
+
+
+def cmd_export(argv):
+    """Export entries in interval: (interval) (csv|jsonl) (file)"""
+    return parse_export(
+        intervalstr=argv[0] if len(argv) > 0 and argv[0] != "-" else None,
+        export_format=argv[1] if len(argv) > 1 else "jsonl",
+        path=argv[2] if len(argv) > 2 else None
     )
 
 
@@ -59,12 +108,31 @@ def cmd_config_init(argv):
     )
 
 
+def parse_options(argv):
+    options = {
+        "--no-config-cache": ("config_cache", False),
+        "--profile": ("profile", "-"),
+    }
+    parsed = {}
+    while len(argv) > 0:
+        [option, _, argument] = argv[0].partition("=")
+        if option not in options:
+            break
+        [key, value] = options[option]
+        parsed[key] = argument or value
+        argv = argv[1:]
+    return parsed, argv
+
+
 def parse_args(argv):
     commands = {
         "t": cmd_start,
         "a": cmd_add,
         "s": cmd_stop,
         "l": cmd_list,
+        "i": cmd_import,
+        "e": cmd_export,
+        "o": cmd_check_overlaps,
         "cs": cmd_config_property,
         "ci": cmd_config_init
     }
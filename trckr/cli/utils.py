@@ -8,6 +8,8 @@ from contextlib import suppress
 
 
 DEFAULT_CONFIG_PATH = os.environ.get("TRCKR_CONFIG", ".trckr.json")
+DEFAULT_CONFIG_CACHE = os.environ.get("TRCKR_NO_CONFIG_CACHE") != "1"
+DEFAULT_PROFILE = os.environ.get("TRCKR_PROFILE")
 BASE_TIME = datetime.now()
 
 
@@ -15,6 +17,14 @@ class CLIParseError(Exception):
     pass
 
 
+def parse_profile_output(value):
+    # "1" profiles to stderr, any other non empty value is a file to
+    # append json lines to.
+    if value is None or value in ["", "0"]:
+        return None
+    return "-" if value == "1" else value
+
+
 def parse_time(date_input):
     current = BASE_TIME
     if (
@@ -52,6 +62,13 @@ def parse_time(date_input):
     raise CLIParseError(f"Failed to parse date input: {date_input}")
 
 
+def _interval_time(date_input):
+    # Like the named intervals, given times do not carry the microseconds
+    # of BASE_TIME, so the same interval parses the same in every run.
+    time = parse_time(date_input)
+    return time if time is BASE_TIME else time.replace(microsecond=0)
+
+
 def parse_interval(interval):
     if interval is None or interval == "-":
         return (None, None)
@@ -65,12 +82,14 @@ def parse_interval(interval):
             current.replace(
                 hour=0,
                 minute=0,
-                second=0
+                second=0,
+                microsecond=0
             ),
             current.replace(
                 hour=23,
                 minute=59,
-                second=59
+                second=59,
+                microsecond=0
             )
         )
     if interval == "week":
@@ -81,36 +100,40 @@ def parse_interval(interval):
             current.replace(
                 hour=0,
                 minute=0,
-                second=0
+                second=0,
+                microsecond=0
             ) - delta_back,
             current.replace(
                 hour=23,
                 minute=59,
-                second=59
+                second=59,
+                microsecond=0
             ) + delta_forward
         )
     elif interval == "month":
-        (start, end) = calendar.monthrange(current.year, current.month)
+        (_, end) = calendar.monthrange(current.year, current.month)
         return (
             current.replace(
-                day=start,
+                day=1,
                 hour=0,
                 minute=0,
-                second=0
+                second=0,
+                microsecond=0
             ),
             current.replace(
                 day=end,
                 hour=23,
-                minute=0,
-                second=0
+                minute=59,
+                second=59,
+                microsecond=0
             )
         )
     else:
         with suppress(ValueError):
             [a, b] = interval.split("-")
             return (
-                parse_time(a),
-                parse_time(b)
+                _interval_time(a),
+                _interval_time(b)
             )
 
     raise CLIParseError(f"Unable to parse interval: '{interval}'")
@@ -153,12 +176,110 @@ def parse_add(intervalstr, metalist, defaults={}):
     }
 
 
-def parse_list(intervalstr, list_format="list"):
+def parse_filters(filterlist):
+    keys = {
+        "user": "userid",
+        "context": "contextid",
+        "note": "note_prefix",
+    }
+    filters = {}
+    for item in filterlist:
+        [key, _, value] = item.partition("=")
+        if key not in keys or value == "":
+            raise CLIParseError(
+                f"Unable to parse filter: '{item}'"
+                f" (use {', '.join(f'{k}=<value>' for k in keys)})"
+            )
+        filters[keys[key]] = value
+    return filters
+
+
+def parse_group_by(group_by):
+    dimensions = ["user", "context", "note", "day", "week", "month"]
+    group_by = [dimension.strip() for dimension in group_by.split(",")]
+    for dimension in group_by:
+        if dimension not in dimensions:
+            raise CLIParseError(
+                f"Unable to parse group by: '{dimension}'"
+                f" (use {', '.join(dimensions)})"
+            )
+    return group_by
+
+
+def parse_list(
+    intervalstr,
+    list_format="list",
+    filters=None,
+    all_dbs=False,
+    group_by=None,
+    sort=None,
+    merge_overlaps=False
+):
     [s, t] = parse_interval(intervalstr)
+    if list_format not in ["list", "json", "yaml", "ndjson", "totals"]:
+        raise CLIParseError(f"Unknown list format: '{list_format}'")
+    if sort is not None and sort not in ["key", "time"]:
+        raise CLIParseError(f"Unknown sort order: '{sort}'")
     return {
         "type": "list",
         "format": list_format,
         "interval": [s, t],
+        "filters": {} if filters is None else filters,
+        "all_dbs": all_dbs,
+        "merge_overlaps": merge_overlaps,
+        **(
+            {}
+            if group_by is None
+            else {"group_by": parse_group_by(group_by)}
+        ),
+        **({} if sort is None else {"sort": sort}),
+    }
+
+
+def parse_check_overlaps(intervalstr, check_format="list"):
+    [s, t] = parse_interval(intervalstr)
+    if check_format not in ["list", "json", "yaml"]:
+        raise CLIParseError(f"Unknown overlap format: '{check_format}'")
+    return {
+        "type": "check-overlaps",
+        "format": check_format,
+        "interval": [s, t],
+    }
+
+
+def parse_import(path, import_format=None, batch_size=None, defaults={}):
+    if import_format is None:
+        import_format = "csv" if path.endswith(".csv") else "jsonl"
+    if import_format not in ["csv", "jsonl"]:
+        raise CLIParseError(f"Unknown import format: '{import_format}'")
+    try:
+        batch_size = None if batch_size is None else int(batch_size)
+    except ValueError:
+        raise CLIParseError(f"Invalid batch size: '{batch_size}'")
+    if batch_size is not None and batch_size < 1:
+        raise CLIParseError(f"Invalid batch size: '{batch_size}'")
+    return {
+        "type": "import",
+        "path": os.path.abspath(path),
+        "format": import_format,
+        "batch_size": batch_size,
+        "meta": defaults
+    }
+
+
+def parse_export(intervalstr, export_format="jsonl", path=None):
+    [s, t] = parse_interval(intervalstr)
+    if export_format not in ["csv", "jsonl"]:
+        raise CLIParseError(f"Unknown export format: '{export_format}'")
+    return {
+        "type": "export",
+        "format": export_format,
+        "interval": [s, t],
+        **(
+            {}
+            if path is None
+            else {"path": os.path.abspath(path)}
+        )
     }
 
 
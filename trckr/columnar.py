@@ -0,0 +1,369 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+from array import array
+from operator import sub
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from .database import Meta
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(time: datetime) -> int:
+    return (time - EPOCH) // MICROSECOND
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class EntryRow:
+    __slots__ = ("start_us", "stop_us", "meta", "id")
+
+    def __init__(self, start_us, stop_us, meta, id):
+        self.start_us = start_us
+        self.stop_us = stop_us
+        self.meta = meta
+        self.id = id
+
+    @property
+    def start(self) -> datetime:
+        return from_micros(self.start_us)
+
+    @property
+    def stop(self) -> datetime:
+        return from_micros(self.stop_us)
+
+    @property
+    def duration(self) -> timedelta:
+        return timedelta(microseconds=self.stop_us - self.start_us)
+
+
+class StringColumn:
+    def __init__(self, values=(), codes=None):
+        self._codes = array("I") if codes is None else codes
+        self._values = [
+            value if value is None else sys.intern(value)
+            for value in values
+        ]
+        self._lookup = {
+            value: code
+            for code, value in enumerate(self._values)
+        }
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def codes(self):
+        return self._codes
+
+    def encode(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self._values)
+            self._values.append(value if value is None else sys.intern(value))
+            self._lookup[value] = code
+        return code
+
+    def insert(self, position, value):
+        self._codes.insert(position, self.encode(value))
+
+    def code(self, position):
+        return self._codes[position]
+
+    def lookup(self, value):
+        return self._lookup.get(value)
+
+    def codes_where(self, predicate):
+        return {
+            code
+            for code, value in enumerate(self._values)
+            if predicate(value)
+        }
+
+    def value(self, position):
+        return self._values[self._codes[position]]
+
+
+class ColumnarEntries:
+    def __init__(self, entries=()):
+        self._starts = array("q")
+        self._stops = array("q")
+        self._ids = []
+        self._userids = StringColumn()
+        self._contextids = StringColumn()
+        self._notes = StringColumn()
+        self._metas = {}
+        self._max_duration = 0
+        for entry in sorted(entries, key=lambda e: e["start"]):
+            self.append(entry)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @staticmethod
+    def from_columns(starts, stops, ids, userids, contextids, notes):
+        # Columns must already be sorted by start.
+        entries = ColumnarEntries()
+        entries._starts = starts
+        entries._stops = stops
+        entries._ids = ids
+        entries._userids = userids
+        entries._contextids = contextids
+        entries._notes = notes
+        entries._max_duration = max(map(sub, stops, starts), default=0)
+        return entries
+
+    def columns(self):
+        return (
+            self._starts,
+            self._stops,
+            self._ids,
+            self._userids,
+            self._contextids,
+            self._notes,
+        )
+
+    def append(self, entry):
+        start = to_micros(datetime.fromisoformat(entry["start"]))
+        stop = to_micros(datetime.fromisoformat(entry["stop"]))
+        meta = entry["meta"]
+        position = bisect_right(self._starts, start)
+        self._starts.insert(position, start)
+        self._stops.insert(position, stop)
+        self._ids.insert(position, entry["id"])
+        self._userids.insert(position, meta["userid"])
+        self._contextids.insert(position, meta["contextid"])
+        self._notes.insert(position, meta["note"])
+        self._max_duration = max(self._max_duration, stop - start)
+
+    def _meta(self, position):
+        key = (
+            self._userids.code(position),
+            self._contextids.code(position),
+            self._notes.code(position),
+        )
+        meta = self._metas.get(key)
+        if meta is None:
+            meta = Meta(
+                userid=self._userids.value(position),
+                contextid=self._contextids.value(position),
+                note=self._notes.value(position),
+            )
+            self._metas[key] = meta
+        return meta
+
+    def _code_filter(self, column, value):
+        if value is None:
+            return None
+        code = column.lookup(value)
+        return set() if code is None else {code}
+
+    def _filters(self, userid=None, contextid=None, note_prefix=None):
+        # Filters are resolved to sets of dictionary codes once, so rows are
+        # rejected by comparing integers.
+        return [
+            (column, codes)
+            for column, codes in [
+                (self._userids, self._code_filter(self._userids, userid)),
+                (
+                    self._contextids,
+                    self._code_filter(self._contextids, contextid)
+                ),
+                (
+                    self._notes,
+                    None
+                    if note_prefix is None
+                    else self._notes.codes_where(
+                        lambda note: (note or "").startswith(note_prefix)
+                    )
+                ),
+            ]
+            if codes is not None
+        ]
+
+    def _range(self, from_us=None, to_us=None):
+        low = (
+            0
+            if from_us is None
+            else bisect_left(self._starts, from_us - self._max_duration)
+        )
+        high = (
+            len(self._starts)
+            if to_us is None
+            else bisect_left(self._starts, to_us)
+        )
+        return low, high
+
+    def select(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ):
+        filters = self._filters(userid, contextid, note_prefix)
+        from_us = None if from_time is None else to_micros(from_time)
+        to_us = None if to_time is None else to_micros(to_time)
+        [low, high] = self._range(from_us, to_us)
+        for position in range(low, high):
+            if not all(
+                column.code(position) in codes
+                for column, codes in filters
+            ):
+                continue
+            start = self._starts[position]
+            stop = self._stops[position]
+            if from_us is not None and from_us > start:
+                start = from_us
+            if to_us is not None and to_us < stop:
+                stop = to_us
+            if start < stop:
+                yield EntryRow(
+                    start,
+                    stop,
+                    self._meta(position),
+                    self._ids[position]
+                )
+
+    def aggregate(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        dimensions=(),
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ):
+        # Vectorized report.aggregate, returns None when NumPy is missing so
+        # the caller can fall back to aggregating select().
+        try:
+            import numpy as np
+        except ImportError:
+            return None
+        from_us = None if from_time is None else to_micros(from_time)
+        to_us = None if to_time is None else to_micros(to_time)
+        [low, high] = self._range(from_us, to_us)
+        if low >= high:
+            return {}
+        starts = np.frombuffer(self._starts, dtype=np.int64)[low:high]
+        stops = np.frombuffer(self._stops, dtype=np.int64)[low:high]
+        if from_us is not None:
+            starts = np.maximum(starts, from_us)
+        if to_us is not None:
+            stops = np.minimum(stops, to_us)
+        mask = starts < stops
+        for column, codes in self._filters(userid, contextid, note_prefix):
+            mask &= np.isin(
+                np.frombuffer(column.codes, dtype=np.uint32)[low:high],
+                np.fromiter(codes, dtype=np.uint32, count=len(codes))
+            )
+        starts = starts[mask]
+        durations = stops[mask] - starts
+        if len(durations) == 0:
+            return {}
+        if len(dimensions) == 0:
+            return {
+                (): [
+                    timedelta(microseconds=int(durations.sum())),
+                    len(durations)
+                ]
+            }
+
+        days = starts // (24 * 60 * 60 * 1000000)
+        strings = {
+            "user": self._userids,
+            "context": self._contextids,
+            "note": self._notes,
+        }
+
+        def _keys(dimension):
+            if dimension in strings:
+                codes = strings[dimension].codes
+                return np.frombuffer(codes, dtype=np.uint32)[low:high][mask]
+            if dimension == "day":
+                return days
+            if dimension == "week":
+                # Day 0, 1970-01-01, is a Thursday.
+                return days - (days + 3) % 7
+            return (
+                starts.astype("datetime64[us]")
+                .astype("datetime64[M]")
+                .astype(np.int64)
+            )
+
+        def _label(dimension, key):
+            if dimension in strings:
+                return strings[dimension].values[key]
+            if dimension == "month":
+                return "%04d-%02d" % (1970 + key // 12, key % 12 + 1)
+            day = EPOCH.date() + timedelta(days=int(key))
+            if dimension == "day":
+                return str(day)
+            return "%04d-W%02d" % day.isocalendar()[:2]
+
+        # Every dimension is reduced to dense codes and folded into a single
+        # int64 group code, compacted after each step so it cannot overflow.
+        groups = np.zeros(len(durations), dtype=np.int64)
+        columns = []
+        for dimension in dimensions:
+            values, codes = np.unique(_keys(dimension), return_inverse=True)
+            columns.append((dimension, values, codes.reshape(-1)))
+            groups = np.unique(
+                groups * len(values) + codes.reshape(-1),
+                return_inverse=True
+            )[1].reshape(-1)
+        size = int(groups.max()) + 1
+        first = np.full(size, len(groups), dtype=np.int64)
+        np.minimum.at(first, groups, np.arange(len(groups)))
+        sums = np.zeros(size, dtype=np.int64)
+        np.add.at(sums, groups, durations)
+        labels = [
+            [_label(dimension, value) for value in values.tolist()]
+            for dimension, values, _ in columns
+        ]
+        keys = zip(*(
+            [column_labels[code] for code in codes[first].tolist()]
+            for column_labels, (_, _, codes) in zip(labels, columns)
+        ))
+        return {
+            key: [timedelta(microseconds=time), count]
+            for key, time, count in zip(
+                keys,
+                sums.tolist(),
+                np.bincount(groups, minlength=size).tolist()
+            )
+        }
+
+    def rows(self):
+        return (
+            EntryRow(
+                self._starts[position],
+                self._stops[position],
+                self._meta(position),
+                self._ids[position]
+            )
+            for position in range(len(self._ids))
+        )
+
+    def to_data(self):
+        return [
+            {
+                "id": self._ids[position],
+                "start": str(from_micros(self._starts[position])),
+                "stop": str(from_micros(self._stops[position])),
+                "meta": {
+                    "userid": self._userids.value(position),
+                    "contextid": self._contextids.value(position),
+                    "note": self._notes.value(position),
+                }
+            }
+            for position in range(len(self._ids))
+        ]
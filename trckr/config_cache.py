@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import json
+import zlib
+from .utils import config_from_json
+from .readwrite import file_state, write_json_atomic
+
+
+CACHE_VERSION = 1
+
+
+def cache_dir():
+    return os.path.join(
+        os.environ.get(
+            "XDG_CACHE_HOME",
+            os.path.join(os.path.expanduser("~"), ".cache")
+        ),
+        "trckr"
+    )
+
+
+def _cache_key(config_path):
+    # Relative git dirs and GITNAME depend on the working directory.
+    return "\0".join([os.path.abspath(config_path), os.getcwd()])
+
+
+def _cache_path(key):
+    digest = zlib.crc32(key.encode("utf-8"))
+    return os.path.join(cache_dir(), f"config-{digest:08x}.json")
+
+
+def fingerprint(files, env):
+    return {
+        "version": CACHE_VERSION,
+        "files": {path: file_state(path) for path in files},
+        "env": {name: os.environ.get(name) for name in env},
+    }
+
+
+def _is_fresh(cached):
+    stored = cached["fingerprint"]
+    return stored == fingerprint(stored["files"], stored["env"])
+
+
+def _read_cache(path, key):
+    try:
+        with open(path, "r") as f:
+            cached = json.load(f)
+        return (
+            cached
+            if cached["key"] == key and _is_fresh(cached)
+            else None
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_cache(path, data):
+    try:
+        write_json_atomic(path, data)
+    except OSError:
+        pass
+
+
+def cached_config(config_path, extensions):
+    key = _cache_key(config_path)
+    path = _cache_path(key)
+    cached = _read_cache(path, key)
+    if cached is not None:
+        return cached["config"]
+
+    used = []
+
+    def _tracked_extensions(data):
+        ext_data = extensions(data)
+        used.append(ext_data)
+        return ext_data
+
+    # Take the config file state before resolving so a concurrent edit
+    # invalidates the entry instead of being masked by it.
+    config_state = fingerprint([config_path], [])
+    config = config_from_json(config_path, _tracked_extensions)
+    dependencies = used[0].dependencies() if len(used) > 0 else {}
+    if dependencies is not None:
+        state = fingerprint(
+            dependencies.get("files", []),
+            dependencies.get("env", [])
+        )
+        _write_cache(path, {
+            "key": key,
+            "fingerprint": {
+                **state,
+                "files": {**config_state["files"], **state["files"]},
+            },
+            "config": config
+        })
+    return config
@@ -0,0 +1,253 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import json
+import socket
+from datetime import datetime
+from .exceptions import TrckrError
+from .profile import span
+from .readwrite import file_state
+
+
+# Exports are streamed by the client itself rather than buffered as one
+# daemon response.
+LOCAL_COMMANDS = ["config", "export"]
+# A daemon that does not accept within CONNECT_TIMEOUT is treated as not
+# running. One that accepts but does not answer within RESPONSE_TIMEOUT
+# fails the command.
+CONNECT_TIMEOUT = 1.0
+RESPONSE_TIMEOUT = 30.0
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    return os.environ.get(
+        "TRCKR_SOCKET",
+        os.path.join(runtime_dir, "trckr.sock")
+        if runtime_dir is not None
+        else f"/tmp/trckr-{os.getuid()}.sock"
+    )
+
+
+def encode(value):
+    if isinstance(value, datetime):
+        return {"$datetime": str(value)}
+    elif isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+
+def decode(value):
+    if isinstance(value, dict):
+        if list(value.keys()) == ["$datetime"]:
+            return datetime.fromisoformat(value["$datetime"])
+        return {key: decode(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+def _send(connection, message):
+    connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def _receive(connection):
+    with connection.makefile("rb") as f:
+        line = f.readline()
+    if not line:
+        raise ConnectionError("Connection closed without a message")
+    return json.loads(line)
+
+
+def request(config, command, socket_path=None):
+    if (
+        command["type"] in LOCAL_COMMANDS
+        or command.get("all_dbs", False)
+        or os.environ.get("TRCKR_NO_DAEMON") == "1"
+    ):
+        raise DaemonUnavailable() from None
+
+    with (
+        span("daemon.request"),
+        socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection
+    ):
+        try:
+            connection.settimeout(CONNECT_TIMEOUT)
+            connection.connect(socket_path or default_socket_path())
+        except (
+            FileNotFoundError,
+            PermissionError,
+            ConnectionError,
+            socket.timeout
+        ):
+            raise DaemonUnavailable() from None
+        try:
+            connection.settimeout(RESPONSE_TIMEOUT)
+            _send(connection, {
+                "config": config,
+                "command": encode(command)
+            })
+            response = _receive(connection)
+        except socket.timeout:
+            from .app import READ_ONLY_COMMANDS
+            # A write may already have been applied by the daemon, running
+            # it again would duplicate it.
+            if command["type"] in READ_ONLY_COMMANDS:
+                raise DaemonUnavailable() from None
+            raise TrckrError(
+                f"Daemon did not respond within {RESPONSE_TIMEOUT:g}s"
+            ) from None
+        except ConnectionError:
+            raise DaemonUnavailable() from None
+
+    if response.get("error") is not None:
+        raise TrckrError(response["error"])
+    return response["output"]
+
+
+class GroupCommitDatabase:
+    def __init__(self, loader, config):
+        self._loader = loader
+        self._config = config
+        self._path = config.get("database", {}).get("path")
+        self.dirty = False
+        self._load()
+
+    def _file_state(self):
+        return None if self._path is None else file_state(self._path)
+
+    def _load(self):
+        self._database = self._loader(self._config)
+        self._state = self._file_state()
+
+    def refresh(self):
+        # Pick up writes made without the daemon, unless there are
+        # uncommitted changes that would be lost.
+        if not self.dirty and self._file_state() != self._state:
+            self._load()
+
+    def commit(self):
+        self.dirty = True
+
+    def flush(self):
+        if not self.dirty:
+            return
+        try:
+            self._database.commit()
+        except OSError:
+            # Kept dirty and retried at the next flush.
+            raise
+        except Exception as e:
+            # The uncommitted writes can not be replayed on top of what
+            # another process committed, e.g. stopping a timer it already
+            # stopped. Drop them rather than staying dirty, which would
+            # keep the daemon from picking up other writes.
+            self._load()
+            self.dirty = False
+            raise TrckrError(
+                f"Dropped uncommitted changes to {self._path}: {e}"
+            ) from e
+        self._state = self._file_state()
+        self.dirty = False
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+def serve(socket_path=None, commit_interval=1.0):
+    import io
+    import signal
+    import threading
+    import socketserver
+    from contextlib import redirect_stdout
+    from . import app
+
+    socket_path = socket_path or default_socket_path()
+    lock = threading.Lock()
+    databases = {}
+    stopped = threading.Event()
+
+    def _database(config):
+        key = json.dumps(config["database"], sort_keys=True)
+        if key not in databases:
+            databases[key] = GroupCommitDatabase(app.load_database, config)
+        database = databases[key]
+        database.refresh()
+        return database
+
+    def _flush():
+        with lock:
+            for database in databases.values():
+                try:
+                    database.flush()
+                except Exception as e:
+                    print(f"Daemon failed to commit: {e}", file=sys.stderr)
+
+    def _flush_periodically():
+        while not stopped.wait(commit_interval):
+            _flush()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            message = json.loads(self.rfile.readline())
+            config = message["config"]
+            command = decode(message["command"])
+            output = io.StringIO()
+            error = None
+            with lock:
+                try:
+                    database = _database(config)
+                    with redirect_stdout(output):
+                        # Uncommitted writes are not part of the store
+                        # version that cached results are keyed on.
+                        app.exec(
+                            config,
+                            database,
+                            command,
+                            result_cache=not database.dirty
+                        )
+                except TrckrError as e:
+                    error = str(e)
+                except Exception as e:
+                    # Always answer, a client that gets no response falls
+                    # back to running the command itself.
+                    error = f"Daemon failed to run command: {e!r}"
+            self.wfile.write(json.dumps({
+                "output": output.getvalue(),
+                "error": error
+            }).encode("utf-8") + b"\n")
+
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+                raise TrckrError(f"Daemon already running on {socket_path}")
+            except ConnectionError:
+                os.unlink(socket_path)
+
+    server = socketserver.UnixStreamServer(socket_path, Handler)
+    os.chmod(socket_path, 0o600)
+    flusher = threading.Thread(target=_flush_periodically, daemon=True)
+    flusher.start()
+
+    def _shutdown(*args):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+        os.unlink(socket_path)
+        _flush()
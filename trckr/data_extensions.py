@@ -2,21 +2,104 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
-import subprocess
-import getpass
+from collections.abc import Mapping
 from datetime import datetime
+from .profile import span
+
+
+class ExtensionData(Mapping):
+    def __init__(self, exts, data):
+        self._exts = exts
+        self._data = data
+        self._results = {}
+
+    def _evaluate(self, ext):
+        if ext not in self._results:
+            with span(f"extension.{ext.__name__}"):
+                self._results[ext] = ext(self._data)
+        return self._results[ext]
+
+    def _may_provide(self, ext, key):
+        provided = getattr(ext, "provides", None)
+        return provided is None or key in provided
+
+    def __getitem__(self, key):
+        # Later extensions override earlier ones, so search backwards and
+        # only evaluate extensions that may provide the key.
+        for ext in reversed(self._exts):
+            if self._may_provide(ext, key):
+                values = self._evaluate(ext)
+                if key in values:
+                    return values[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        keys = {}
+        for ext in self._exts:
+            provided = getattr(ext, "provides", None)
+            keys.update(dict.fromkeys(
+                self._evaluate(ext) if provided is None else provided
+            ))
+        return iter(keys)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def dependencies(self):
+        files = []
+        env = []
+        for ext in self._results:
+            watch = getattr(ext, "watches", None)
+            dependencies = None if watch is None else watch(self._data)
+            if dependencies is None:
+                return None
+            files.extend(dependencies.get("files", []))
+            env.extend(dependencies.get("env", []))
+        return {
+            "files": files,
+            "env": env
+        }
+
+
+def provides(*keys):
+    def _provides(ext):
+        ext.provides = frozenset(keys)
+        return ext
+
+    return _provides
+
+
+def watches(dependencies):
+    def _watches(ext):
+        ext.watches = dependencies
+        return ext
+
+    return _watches
+
+
+def _no_dependencies(data):
+    return {}
+
+
+def _volatile(data):
+    return None
+
+
+def _userspace_dependencies(data):
+    return {
+        "env": ["HOME", "LOGNAME", "USER", "LNAME", "USERNAME"]
+    }
 
 
 def extensions(*exts):
     def _extenstions(data):
-        ext_data = {}
-        for ext in exts:
-            ext_data.update(ext(data))
-        return ext_data
+        return ExtensionData(exts, data)
 
     return _extenstions
 
 
+@provides("CONFIG_DIR", "CONFIG_PATH")
+@watches(_no_dependencies)
 def config(data):
     config_path = data["_path"]
     config_dir = os.path.dirname(config_path)
@@ -26,13 +109,19 @@ def config(data):
     }
 
 
+@provides("HOME", "USER")
+@watches(_userspace_dependencies)
 def userspace(data):
+    import getpass
+
     return {
         "HOME": os.path.expanduser("~"),
         "USER": getpass.getuser()
     }
 
 
+@provides("NOW", "TODAY")
+@watches(_volatile)
 def time(data):
     return {
         "NOW": str(datetime.now()),
@@ -40,13 +129,69 @@ def time(data):
     }
 
 
-def git(data):
-    config_dir = os.path.dirname(data["_path"])
-    gitdir = data.get(
-        "gitdir",
-        os.path.join(config_dir, ".git")
+def _read_text(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _is_plain_gitdir(gitdir):
+    config = _read_text(os.path.join(gitdir, "config")) or ""
+    return (
+        os.path.isfile(os.path.join(gitdir, "HEAD"))
+        and not os.path.exists(os.path.join(gitdir, "commondir"))
+        and "worktree" not in config
+        and "GIT_WORK_TREE" not in os.environ
     )
 
+
+def _resolve_ref(gitdir, ref):
+    value = _read_text(os.path.join(gitdir, ref))
+    if value is None:
+        packed_refs = _read_text(os.path.join(gitdir, "packed-refs")) or ""
+        value = next(
+            (
+                line.split(" ", 1)[0]
+                for line in packed_refs.splitlines()
+                if not line.startswith(("#", "^"))
+                and line.split(" ", 1)[-1] == ref
+            ),
+            None
+        )
+    if value is not None and value.startswith("ref: "):
+        return _resolve_ref(gitdir, value[len("ref: "):])
+    return value
+
+
+def _git_from_directory(gitdir):
+    head = _read_text(os.path.join(gitdir, "HEAD"))
+    if head.startswith("ref: "):
+        ref = head[len("ref: "):]
+        branch = (
+            ref[len("refs/heads/"):]
+            if ref.startswith("refs/heads/")
+            else ""
+        )
+        githash = _resolve_ref(gitdir, ref)
+    else:
+        branch = ""
+        githash = head
+
+    # Without a configured work tree git treats the working directory as
+    # the top level when --git-dir is given.
+    return {
+        "GITBRANCH": branch,
+        "GITHASH": None if githash is None else githash[:7],
+        "GITHASHLONG": githash,
+        "GITNAME": os.path.basename(os.getcwd())
+    }
+
+
+def _git_from_subprocess(gitdir):
+    import subprocess
+
     def _git_command(*cmd):
         try:
             cmd_list = ["git", "--git-dir", gitdir, *cmd]
@@ -64,6 +209,45 @@ def git(data):
     }
 
 
+def _gitdir(data):
+    config_dir = os.path.dirname(data["_path"])
+    return data.get(
+        "gitdir",
+        os.path.join(config_dir, ".git")
+    )
+
+
+def _git_dependencies(data):
+    gitdir = _gitdir(data)
+    if not _is_plain_gitdir(gitdir):
+        return None
+
+    head = _read_text(os.path.join(gitdir, "HEAD"))
+    refs = (
+        [os.path.join(gitdir, head[len("ref: "):])]
+        if head.startswith("ref: ")
+        else []
+    )
+    return {
+        "files": [
+            os.path.join(gitdir, "HEAD"),
+            os.path.join(gitdir, "config"),
+            os.path.join(gitdir, "packed-refs"),
+            *refs
+        ],
+        "env": ["GIT_WORK_TREE"]
+    }
+
+
+@provides("GITBRANCH", "GITHASH", "GITHASHLONG", "GITNAME")
+@watches(_git_dependencies)
+def git(data):
+    gitdir = _gitdir(data)
+    if _is_plain_gitdir(gitdir):
+        return _git_from_directory(gitdir)
+    return _git_from_subprocess(gitdir)
+
+
 standard_extensions = extensions(
     config,
     userspace,
@@ -1,15 +1,37 @@
 # SPDX-FileCopyrightText: 2022 Mattias Nyberg
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import uuid
-from datetime import datetime
+import sys
+from bisect import bisect_right
+from operator import itemgetter
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Iterable
 from dataclasses import dataclass, asdict
 from collections import ChainMap
+from .index import IntervalIndex
 from .exceptions import TrckrError
 
 
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class _Starts:
+    # The starts of a list of entry dicts as a sequence bisect can search.
+    def __init__(self, entries):
+        self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, position):
+        return self._entries[position]["start"]
+
+
 @dataclass
 class Meta:
+    __slots__ = ("userid", "contextid", "note")
     userid: str
     contextid: str
     note: str
@@ -17,19 +39,24 @@ class Meta:
     @staticmethod
     def from_data(data):
         return Meta(
-            userid=data["userid"],
-            contextid=data["contextid"],
-            note=data["note"],
+            userid=_intern(data["userid"]),
+            contextid=_intern(data["contextid"]),
+            note=_intern(data["note"]),
         )
 
 
 @dataclass
 class Entry:
+    __slots__ = ("start", "stop", "meta", "id")
     start: datetime
     stop: datetime
     meta: Meta
     id: str
 
+    @property
+    def duration(self) -> timedelta:
+        return self.stop - self.start
+
     def intersection(self, start, stop):
         start = (
             start
@@ -61,6 +88,38 @@ class Entry:
         )
 
 
+def meta_matcher(userid=None, contextid=None, note_prefix=None):
+    def _matches(meta) -> bool:
+        return (
+            (userid is None or meta["userid"] == userid)
+            and (contextid is None or meta["contextid"] == contextid)
+            and (
+                note_prefix is None
+                or (meta["note"] or "").startswith(note_prefix)
+            )
+        )
+
+    return _matches
+
+
+def migration_ops(source):
+    for entry in source.entries:
+        yield {
+            "op": "add",
+            "entry": {
+                "id": entry.id,
+                "start": str(entry.start),
+                "stop": str(entry.stop),
+                "meta": asdict(entry.meta)
+            }
+        }
+    if source.timer is not None:
+        yield {
+            "op": "start",
+            "entry": source.timer
+        }
+
+
 class DatabaseInterface:
     def start(self, time: datetime, meta: Meta = None):
         raise NotImplementedError()
@@ -71,32 +130,78 @@ class DatabaseInterface:
     def add(self, start: datetime, stop: datetime, meta: Meta = None):
         raise NotImplementedError()
 
+    def add_many(
+        self,
+        entries: Iterable[tuple[datetime, datetime, Meta]]
+    ) -> int:
+        count = 0
+        for start, stop, meta in entries:
+            self.add(start, stop, meta)
+            count += 1
+        return count
+
     def commit(self):
         raise NotImplementedError()
 
     def select(
+        self,
         from_time: datetime = None,
-        to_time: datetime = None
-    ) -> list[Entry]:
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> Iterable[Entry]:
         raise NotImplementedError()
 
     @property
     def entries(self) -> list[Entry]:
         raise NotImplementedError()
 
+    @property
+    def timer(self):
+        raise NotImplementedError()
 
-class StructDatabase(DatabaseInterface):
-    def __init__(self, rw):
-        self._rw = rw
-        self._data = ChainMap(
-            self._rw.read({}),
-            {
-                "entries": [],
-                "timer": None
-            },
+    def totals(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        **filters
+    ) -> dict[tuple[str, str], timedelta]:
+        totals = {}
+        for entry in self.select(from_time, to_time, **filters):
+            key = (entry.meta.userid, entry.meta.contextid)
+            totals[key] = totals.get(key, timedelta()) + entry.duration
+        return totals
+
+    def aggregate(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        dimensions: list[str] = (),
+        **filters
+    ) -> dict[tuple, list]:
+        from .report import aggregate
+        return aggregate(
+            self.select(from_time, to_time, **filters),
+            dimensions
         )
 
+
+class OpLogDatabase(DatabaseInterface):
+    # Changes are recorded as ops, applied in memory and kept pending until
+    # the commit. Stores provide _reset, _append_entry, _set_timer and
+    # _migration_lock.
+    def _rebase(self):
+        # Another process committed since we loaded, replay our changes on
+        # top of what it wrote.
+        pending = self._pending
+        self._reset()
+        for op in pending:
+            self._apply(op)
+        self._pending = pending
+
     def _generate_id(self):
+        import uuid
         return str(uuid.uuid4())
 
     def _entry(
@@ -112,56 +217,517 @@ class StructDatabase(DatabaseInterface):
             "meta": asdict(meta)
         }
 
-    def _entries(self):
-        return (
-            Entry.from_data(entry)
-            for entry in self._data["entries"]
-        )
-
-    def _stop(self, time: datetime):
-        timer = self._data["timer"]
+    def _stop(self, time: str):
+        timer = self.timer
         if timer is not None:
-            old_timer = {
+            self._set_timer(None)
+            self._append_entry({
                 **timer,
-                "stop": str(time)
-            }
-            self._data["timer"] = None
-            self._data["entries"].append(old_timer)
+                "stop": time
+            })
+
+    def _apply(self, op):
+        if op["op"] == "add":
+            self._append_entry(op["entry"])
+        elif op["op"] == "start":
+            self._stop(op["entry"]["start"])
+            self._set_timer(op["entry"])
+        elif op["op"] == "stop":
+            self._stop(op["time"])
+        else:
+            raise TrckrError(f"Unknown database operation: {op['op']}")
+
+    def _record(self, op):
+        self._apply(op)
+        self._pending.append(op)
 
     def start(self, time: datetime, meta: Meta = None):
-        self._stop(time)
-        self._data["timer"] = self._entry(time, meta=meta)
+        self._record({
+            "op": "start",
+            "entry": self._entry(time, meta=meta)
+        })
 
     def stop(self, time: datetime):
-        timer = self._data["timer"]
-        if timer is not None:
-            self._stop(time)
+        if self.timer is not None:
+            self._record({
+                "op": "stop",
+                "time": str(time)
+            })
         else:
             raise TrckrError("No existing timer to stop.")
 
     def add(self, start: datetime, stop: datetime, meta: Meta = None):
-        self._data["entries"].append(
-            self._entry(start, stop, meta)
+        self._record({
+            "op": "add",
+            "entry": self._entry(start, stop, meta)
+        })
+
+    def migrate(self, source):
+        with self._migration_lock():
+            # Another process may have migrated while we waited for the lock.
+            self._reset()
+            if not self.is_empty():
+                return
+            for op in migration_ops(source):
+                self._record(op)
+            self.commit()
+
+
+class StructDatabase(OpLogDatabase):
+    # Schema written on commit, stores of either version are read.
+    schema_version = 1
+
+    def __init__(self, rw, rollups=False, schema_version=None):
+        self._rw = rw
+        self._pending = []
+        self._rollups_enabled = rollups
+        if schema_version is not None:
+            if schema_version not in [1, 2]:
+                raise TrckrError(
+                    f"Unsupported database schema version: {schema_version}"
+                )
+            self.schema_version = schema_version
+        self._reset()
+
+    def _reset(self):
+        self._interval_index = None
+        self._rollups = None
+        self._data = self._load()
+        if self._rollups_enabled and self._rollups is None:
+            self._restore_rollups()
+
+    def _from_data(self, data):
+        from .schema import schema_version
+        if schema_version(data) != 1:
+            data = self._decode(data)
+        data = ChainMap(
+            data,
+            {
+                "entries": [],
+                "timer": None
+            },
         )
+        if not data.get("chronological", False):
+            # Stores written before entries were kept in start order.
+            data["entries"] = self._in_start_order(data["entries"])
+        return data
+
+    def _decode(self, data):
+        from .schema import decode
+        return decode(data)
+
+    def _in_start_order(self, entries):
+        return sorted(entries, key=itemgetter("start"))
+
+    def _load(self):
+        return self._from_data(self._rw.read({}))
+
+    def _entries(self):
+        return (
+            Entry.from_data(entry)
+            for entry in self._data["entries"]
+        )
+
+    def _index_item(self, entry):
+        start = datetime.fromisoformat(entry["start"])
+        stop = datetime.fromisoformat(entry["stop"])
+        return start, stop, (start, stop, entry)
+
+    def _index(self):
+        if self._interval_index is None:
+            self._interval_index = IntervalIndex(
+                self._index_item(entry)
+                for entry in self._data["entries"]
+            )
+        return self._interval_index
+
+    def _restore_rollups(self):
+        from .rollups import Rollups
+        data = self._data.get("rollups")
+        if data is not None and data["count"] == len(self._data["entries"]):
+            self._rollups = Rollups.from_data(data)
+        else:
+            self._rollups = Rollups.from_entries(self._entries())
+
+    def _store_entry(self, entry):
+        entries = self._data["entries"]
+        position = bisect_right(_Starts(entries), entry["start"])
+        entries.insert(position, entry)
+        if self._interval_index is not None:
+            self._interval_index.insert(*self._index_item(entry))
+
+    def _append_entry(self, entry):
+        self._store_entry(entry)
+        if self._rollups is not None:
+            self._rollups.add(
+                datetime.fromisoformat(entry["start"]),
+                datetime.fromisoformat(entry["stop"]),
+                entry["meta"]["userid"],
+                entry["meta"]["contextid"]
+            )
+
+    def _set_timer(self, timer):
+        self._data["timer"] = timer
+
+    def _serialize(self):
+        data = {
+            key: value
+            for key, value in self._data.items()
+            if key != "rollups"
+        }
+        data["chronological"] = True
+        if self._rollups is not None:
+            data["rollups"] = self._rollups.to_data()
+        if (
+            self.schema_version == 2
+            and not getattr(self._rw, "columnar", False)
+        ):
+            from .schema import encode
+            return encode(data)
+        return data
+
+    def _write(self):
+        return self._rw.write_if_unchanged(self._serialize())
 
     def commit(self):
-        self._rw.write(dict(self._data))
+        while not self._write():
+            self._rebase()
+        self._pending = []
 
     def select(
         self,
         from_time: datetime = None,
-        to_time: datetime = None
-    ) -> list[Entry]:
-        entries = (
-            entry.intersection(from_time, to_time)
-            for entry in self._entries()
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> Iterable[Entry]:
+        matches = meta_matcher(userid, contextid, note_prefix)
+        candidates = self._index().overlapping(from_time, to_time)
+        for start, stop, data in candidates:
+            # Filter on the stored dict so rejected entries are never
+            # decoded.
+            if not matches(data["meta"]):
+                continue
+            entry = Entry(
+                start=start,
+                stop=stop,
+                meta=Meta.from_data(data["meta"]),
+                id=data["id"]
+            ).intersection(from_time, to_time)
+            if entry is not None:
+                yield entry
+
+    @property
+    def entries(self) -> list[Entry]:
+        return list(self._entries())
+
+    @property
+    def timer(self):
+        return self._data["timer"]
+
+    def is_empty(self):
+        return len(self._data["entries"]) == 0 and self._data["timer"] is None
+
+    def _migration_lock(self):
+        return self._rw.lock()
+
+    def totals(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> dict[tuple[str, str], timedelta]:
+        filters = {
+            "userid": userid,
+            "contextid": contextid,
+            "note_prefix": note_prefix,
+        }
+        if self._rollups is None or note_prefix is not None:
+            return super().totals(from_time, to_time, **filters)
+
+        from .rollups import midnight
+        # Whole days inside the range come from the rollups, the partial
+        # days at the edges are scanned.
+        first_day = (
+            None
+            if from_time is None
+            else from_time.date() + timedelta(
+                days=0 if from_time == midnight(from_time.date()) else 1
+            )
         )
-        return [
-            entry
-            for entry in entries
-            if entry is not None
+        last_day = (
+            None
+            if to_time is None
+            else to_time.date() - timedelta(days=1)
+        )
+        if (
+            first_day is not None
+            and last_day is not None
+            and first_day > last_day
+        ):
+            return super().totals(from_time, to_time, **filters)
+
+        totals = {
+            (rollup_userid, rollup_contextid): time
+            for [rollup_userid, rollup_contextid], time
+            in self._rollups.totals(first_day, last_day).items()
+            if (userid is None or rollup_userid == userid)
+            and (contextid is None or rollup_contextid == contextid)
+        }
+        edges = [
+            *(
+                [(from_time, midnight(first_day))]
+                if from_time is not None
+                else []
+            ),
+            *(
+                [(midnight(last_day + timedelta(days=1)), to_time)]
+                if to_time is not None
+                else []
+            ),
         ]
+        for [edge_from, edge_to] in edges:
+            edge_totals = super().totals(edge_from, edge_to, **filters)
+            for key, time in edge_totals.items():
+                totals[key] = totals.get(key, timedelta()) + time
+        return totals
+
+
+class ColumnarStructDatabase(StructDatabase):
+    # The columns map straight onto the version 2 rows.
+    schema_version = 2
+
+    def _decode(self, data):
+        from .schema import decode_columnar
+        return decode_columnar(data)
+
+    def _in_start_order(self, entries):
+        # ColumnarEntries keeps itself sorted.
+        return entries
+
+    def _load(self):
+        from .columnar import ColumnarEntries
+        data = super()._load()
+        self._columns = (
+            data["entries"]
+            if isinstance(data["entries"], ColumnarEntries)
+            else ColumnarEntries(data["entries"])
+        )
+        data["entries"] = self._columns
+        return data
+
+    def _store_entry(self, entry):
+        self._columns.append(entry)
+
+    def _entries(self):
+        return self._columns.rows()
+
+    def _serialize(self):
+        data = super()._serialize()
+        if (
+            data.get("entries") is self._columns
+            and not getattr(self._rw, "columnar", False)
+        ):
+            # A version 1 json store.
+            data["entries"] = self._columns.to_data()
+        return data
+
+    def select(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> Iterable[Entry]:
+        return self._columns.select(
+            from_time,
+            to_time,
+            userid,
+            contextid,
+            note_prefix
+        )
+
+    def aggregate(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        dimensions: list[str] = (),
+        **filters
+    ) -> dict[tuple, list]:
+        from .report import validate_dimensions
+        validate_dimensions(dimensions)
+        groups = self._columns.aggregate(
+            from_time,
+            to_time,
+            dimensions,
+            **filters
+        )
+        if groups is None:
+            return super().aggregate(from_time, to_time, dimensions, **filters)
+        return groups
+
+
+class JournalDatabase(StructDatabase):
+    def __init__(
+        self,
+        rw,
+        compact_after=1000,
+        rollups=False,
+        schema_version=None
+    ):
+        self._compact_after = compact_after
+        super().__init__(rw, rollups=rollups, schema_version=schema_version)
+
+    def _load(self):
+        records = self._rw.read([])
+        self._data = ChainMap({}, {"entries": [], "timer": None})
+        for record in records:
+            if record["op"] == "snapshot":
+                self._data = self._from_data(record["data"])
+                self._interval_index = None
+                if self._rollups_enabled:
+                    self._restore_rollups()
+            else:
+                self._apply(record)
+        self._journal_length = len(records)
+        return self._data
+
+    def _write(self, compact=False):
+        if (
+            compact
+            or self._journal_length + len(self._pending) > self._compact_after
+        ):
+            written = self._rw.write_if_unchanged([{
+                "op": "snapshot",
+                "data": self._serialize()
+            }])
+            journal_length = 1
+        else:
+            written = self._rw.append_if_unchanged(self._pending)
+            journal_length = self._journal_length + len(self._pending)
+        if written:
+            self._journal_length = journal_length
+        return written
+
+    def compact(self):
+        while not self._write(compact=True):
+            self._rebase()
+        self._pending = []
+
+
+def _stream_rows(version, entries, tables):
+    # Rows of (start, stop, meta, id) with the stored times, a function
+    # giving the stored form of a datetime and one parsing a stored time.
+    if version == 1:
+        # Stored times are str(datetime), which sorts like the datetimes.
+        return (
+            (
+                (data["start"], data["stop"], data["meta"], data["id"])
+                for data in entries
+            ),
+            str,
+            datetime.fromisoformat
+        )
+    from .schema import decode_meta
+    from .columnar import to_micros, from_micros
+    meta = decode_meta(tables)
+    return (
+        (
+            (start, stop, meta(userid, contextid, note), id)
+            for [start, stop, userid, contextid, note, id] in entries
+        ),
+        to_micros,
+        from_micros
+    )
+
+
+class StreamingStructDatabase(DatabaseInterface):
+    # Read only view of a json struct store that decodes one entry at a
+    # time instead of loading the whole file.
+    def __init__(self, rw):
+        self._rw = rw
+
+    def _items(self):
+        return closing(self._rw.stream(streamed=("entries",)))
+
+    def select(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> Iterable[Entry]:
+        from .schema import TABLES, SCHEMA_VERSION
+        matches = meta_matcher(userid, contextid, note_prefix)
+        version = 1
+        chronological = False
+        tables = {}
+        unordered = []
+        with self._items() as items:
+            for key, value in items:
+                if key == "schema_version":
+                    version = value
+                    if version not in [1, SCHEMA_VERSION]:
+                        raise TrckrError(
+                            f"Unsupported database schema version: {version}"
+                        )
+                elif key == "chronological":
+                    chronological = value
+                elif key in TABLES:
+                    tables[key] = value
+                elif key == "entries":
+                    [rows, time_key, parse] = _stream_rows(
+                        version,
+                        value,
+                        tables
+                    )
+                    # Entries outside the range are rejected before their
+                    # times are parsed.
+                    from_key = (
+                        None if from_time is None else time_key(from_time)
+                    )
+                    to_key = None if to_time is None else time_key(to_time)
+                    for [start_key, stop_key, meta_data, id] in rows:
+                        if to_key is not None and start_key >= to_key:
+                            # In a chronological store nothing later can
+                            # overlap the range.
+                            if chronological:
+                                break
+                            continue
+                        if from_key is not None and stop_key <= from_key:
+                            continue
+                        if not matches(meta_data):
+                            continue
+                        start = parse(start_key)
+                        entry = Entry(
+                            start=start,
+                            stop=parse(stop_key),
+                            meta=Meta.from_data(meta_data),
+                            id=id
+                        ).intersection(from_time, to_time)
+                        if entry is None:
+                            continue
+                        if chronological:
+                            yield entry
+                        else:
+                            unordered.append((start, entry))
+                    break
+        for _, entry in sorted(unordered, key=itemgetter(0)):
+            yield entry
 
     @property
     def entries(self) -> list[Entry]:
-        return list(self._entries())
+        return list(self.select())
+
+    @property
+    def timer(self):
+        with self._items() as items:
+            for key, value in items:
+                if key == "timer":
+                    return value
+        return None
@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import heapq
+import sqlite3
+from typing import Iterable
+from contextlib import contextmanager
+from operator import attrgetter
+from datetime import datetime, timedelta
+from .database import DatabaseInterface, Entry
+from .utils import first_database, reader_loaders
+from .report import merge_groups
+from .exceptions import TrckrError
+
+
+def _load(dbconf):
+    return first_database(reader_loaders)({"database": dbconf})
+
+
+@contextmanager
+def _reading(dbconf):
+    # A glob may match files that are not stores of the configured type.
+    try:
+        yield
+    except (OSError, ValueError, sqlite3.DatabaseError) as e:
+        raise TrckrError(
+            f"Unable to read database {dbconf['path']}: {e}"
+        ) from None
+
+
+def _select(dbconf, from_time, to_time, filters):
+    with _reading(dbconf):
+        return list(_load(dbconf).select(from_time, to_time, **filters))
+
+
+def _totals(dbconf, from_time, to_time, filters):
+    with _reading(dbconf):
+        return _load(dbconf).totals(from_time, to_time, **filters)
+
+
+def _aggregate(dbconf, from_time, to_time, dimensions, filters):
+    with _reading(dbconf):
+        return _load(dbconf).aggregate(
+            from_time,
+            to_time,
+            dimensions,
+            **filters
+        )
+
+
+class FederatedDatabase(DatabaseInterface):
+    # Read only union of several stores. Every store is queried in its own
+    # process so the slowest store, not the sum of them, bounds a query.
+    def __init__(self, dbconfs):
+        self._dbconfs = dbconfs
+
+    def _map(self, query, *args):
+        if len(self._dbconfs) < 2:
+            return [query(dbconf, *args) for dbconf in self._dbconfs]
+        from concurrent.futures import ProcessPoolExecutor
+        workers = min(len(self._dbconfs), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                query,
+                self._dbconfs,
+                *([arg] * len(self._dbconfs) for arg in args)
+            ))
+
+    def select(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> Iterable[Entry]:
+        filters = {
+            "userid": userid,
+            "contextid": contextid,
+            "note_prefix": note_prefix,
+        }
+        results = self._map(_select, from_time, to_time, filters)
+        return heapq.merge(*results, key=attrgetter("start"))
+
+    def totals(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        **filters
+    ) -> dict[tuple[str, str], timedelta]:
+        totals = {}
+        for store_totals in self._map(_totals, from_time, to_time, filters):
+            for key, time in store_totals.items():
+                totals[key] = totals.get(key, timedelta()) + time
+        return totals
+
+    def aggregate(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        dimensions: list[str] = (),
+        **filters
+    ) -> dict[tuple, list]:
+        groups = {}
+        for store_groups in self._map(
+            _aggregate,
+            from_time,
+            to_time,
+            dimensions,
+            filters
+        ):
+            merge_groups(groups, store_groups)
+        return groups
+
+    @property
+    def entries(self) -> list[Entry]:
+        return list(self.select())
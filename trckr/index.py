@@ -0,0 +1,45 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import islice
+
+
+class IntervalIndex:
+    def __init__(self, intervals=()):
+        ordered = sorted(intervals, key=lambda interval: interval[0])
+        self._starts = [start for start, _, _ in ordered]
+        self._items = [item for _, _, item in ordered]
+        self._max_duration = max(
+            (stop - start for start, stop, _ in ordered),
+            default=timedelta()
+        )
+
+    def __len__(self):
+        return len(self._items)
+
+    def insert(self, start: datetime, stop: datetime, item):
+        position = bisect_right(self._starts, start)
+        self._starts.insert(position, start)
+        self._items.insert(position, item)
+        self._max_duration = max(self._max_duration, stop - start)
+
+    def overlapping(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None
+    ):
+        # No interval is longer than the longest one seen, so anything
+        # starting before from_time - max_duration has already ended.
+        low = (
+            0
+            if from_time is None
+            else bisect_left(self._starts, from_time - self._max_duration)
+        )
+        high = (
+            len(self._starts)
+            if to_time is None
+            else bisect_left(self._starts, to_time)
+        )
+        return islice(self._items, low, high)
@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import re
+import json
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_REST = re.compile(r"[0-9.eE+-]*\Z")
+_decoder = json.JSONDecoder()
+
+
+class JsonStream:
+    # Walks a top level json object one value at a time, keeping only the
+    # undecoded rest of the current chunk in memory.
+    def __init__(self, f, chunk_size=1 << 16):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+
+    def _fill(self, size):
+        if self._eof:
+            return False
+        chunk = self._f.read(size)
+        if chunk == "":
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self._position = _WHITESPACE.match(
+                self._buffer,
+                self._position
+            ).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill(self._chunk_size):
+                raise json.JSONDecodeError(
+                    "Unexpected end of data",
+                    self._buffer,
+                    self._position
+                )
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise json.JSONDecodeError(
+                f"Expecting '{char}'",
+                self._buffer,
+                self._position
+            )
+        self._position += 1
+
+    def _value(self):
+        self._peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+                # A number cut at the end of the buffer, possibly at a
+                # ".", exponent or sign, may continue in the next chunk.
+                if self._eof or not (
+                    isinstance(value, (int, float))
+                    and not isinstance(value, bool)
+                    and _NUMBER_REST.match(self._buffer, end)
+                ):
+                    self._position = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Grow the read size so a large value is decoded in amortized
+            # linear time.
+            self._fill(size)
+            size *= 2
+
+    def _array(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self._position += 1
+            return
+        while True:
+            yield self._value()
+            if self._peek() == "]":
+                self._position += 1
+                return
+            self._expect(",")
+
+    def items(self, streamed=()):
+        # Arrays under the keys in `streamed` are yielded as iterators over
+        # their items, and are skipped if not consumed before the next key.
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key in streamed and self._peek() == "[":
+                values = self._array()
+                yield key, values
+                for _ in values:
+                    pass
+            else:
+                yield key, self._value()
+            if self._peek() == "}":
+                return
+            self._expect(",")
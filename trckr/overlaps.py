@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from heapq import heappush, heappop
+from operator import attrgetter
+from datetime import datetime, timedelta
+from typing import Iterable
+from .database import DatabaseInterface, Entry, Meta
+
+
+def find_overlaps(entries):
+    # Sweep over the entries in start order keeping, per user, a heap of the
+    # entries still running. Everything left on the heap once the finished
+    # entries are popped overlaps the next entry. O(n log n + overlaps).
+    running = {}
+    entries = sorted(entries, key=attrgetter("start"))
+    for position, entry in enumerate(entries):
+        heap = running.setdefault(entry.meta.userid, [])
+        while len(heap) > 0 and heap[0][0] <= entry.start:
+            heappop(heap)
+        for [stop, _, other] in heap:
+            yield other, entry, entry.start, min(stop, entry.stop)
+        heappush(heap, (entry.stop, position, entry))
+
+
+def merge_overlaps(entries):
+    # Clips every entry to the part not covered by entries of the same user
+    # that started before it, so durations add up to the union of the
+    # intervals and shared time counts towards the earliest entry.
+    covered = {}
+    for entry in sorted(entries, key=attrgetter("start")):
+        userid = entry.meta.userid
+        covered_until = covered.get(userid)
+        if covered_until is None or covered_until <= entry.start:
+            covered[userid] = entry.stop
+            yield entry
+        elif covered_until < entry.stop:
+            covered[userid] = entry.stop
+            yield Entry(
+                start=covered_until,
+                stop=entry.stop,
+                meta=entry.meta,
+                id=entry.id
+            )
+
+
+class MergedOverlapsDatabase(DatabaseInterface):
+    # Read only view where entries of a user never overlap, totals and
+    # reports are computed over the union of the intervals.
+    def __init__(self, db):
+        self._db = db
+
+    def select(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> Iterable[Entry]:
+        return merge_overlaps(self._db.select(
+            from_time,
+            to_time,
+            userid=userid,
+            contextid=contextid,
+            note_prefix=note_prefix
+        ))
+
+    @property
+    def entries(self) -> list[Entry]:
+        return list(self.select())
+
+
+def timer_entry(timer, now=None):
+    # The running timer as an entry stopping now.
+    if timer is None:
+        return None
+    start = datetime.fromisoformat(timer["start"])
+    now = datetime.now() if now is None else now
+    if start >= now:
+        return None
+    return Entry(
+        start=start,
+        stop=now,
+        meta=Meta.from_data(timer["meta"]),
+        id=timer["id"]
+    )
+
+
+def overlap_report(db, from_time=None, to_time=None):
+    entries = list(db.select(from_time, to_time))
+    timer = timer_entry(db.timer)
+    if timer is not None:
+        timer = timer.intersection(from_time, to_time)
+        if timer is not None:
+            entries.append(timer)
+    overlaps = sorted(
+        find_overlaps(entries),
+        key=lambda overlap: (overlap[0].meta.userid, overlap[2])
+    )
+    # Time counted more than once, the total minus the union.
+    double_counted = {}
+    for entry in entries:
+        userid = entry.meta.userid
+        double_counted[userid] = (
+            double_counted.get(userid, timedelta()) + entry.duration
+        )
+    for entry in merge_overlaps(entries):
+        double_counted[entry.meta.userid] -= entry.duration
+    return {
+        "overlaps": overlaps,
+        "timer": None if timer is None else timer.id,
+        "double_counted": {
+            userid: time
+            for userid, time in double_counted.items()
+            if time > timedelta()
+        },
+    }
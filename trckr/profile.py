@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+import time
+from contextlib import nullcontext
+
+
+# Spans are only collected after enable(), until then span() hands out a
+# shared no-op context and the database is not wrapped at all.
+_spans = None
+_depth = 0
+_output = None
+_started = None
+_DISABLED = nullcontext()
+_END = object()
+
+
+def enable(output="-"):
+    global _spans, _output, _started
+    _spans = []
+    _output = output
+    _started = time.perf_counter()
+
+
+def enabled():
+    return _spans is not None
+
+
+class _Span:
+    __slots__ = ("_record", "_started")
+
+    def __init__(self, name):
+        self._record = {"name": name, "depth": _depth, "seconds": 0.0}
+
+    def __enter__(self):
+        global _depth
+        _spans.append(self._record)
+        _depth += 1
+        self._started = time.perf_counter()
+        return self._record
+
+    def __exit__(self, *exc_info):
+        global _depth
+        self._record["seconds"] = time.perf_counter() - self._started
+        _depth -= 1
+        return False
+
+
+def span(name):
+    return _DISABLED if _spans is None else _Span(name)
+
+
+def timed_iter(name, iterable):
+    return iterable if _spans is None else _timed_iter(name, iterable)
+
+
+def _timed_iter(name, iterable):
+    # Only the time spent producing items is counted, not the time the
+    # consumer spends between them.
+    record = {"name": name, "depth": _depth, "seconds": 0.0}
+    _spans.append(record)
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        item = next(iterator, _END)
+        record["seconds"] += time.perf_counter() - started
+        if item is _END:
+            return
+        yield item
+
+
+class ProfiledDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def select(self, *args, **kargs):
+        return timed_iter("select", self._db.select(*args, **kargs))
+
+    def totals(self, *args, **kargs):
+        with span("totals"):
+            return self._db.totals(*args, **kargs)
+
+    def aggregate(self, *args, **kargs):
+        with span("aggregate"):
+            return self._db.aggregate(*args, **kargs)
+
+    def add_many(self, entries):
+        with span("add_many"):
+            return self._db.add_many(entries)
+
+    def commit(self):
+        with span("commit"):
+            return self._db.commit()
+
+
+def profiled_database(db):
+    return db if _spans is None else ProfiledDatabase(db)
+
+
+def _print_report(spans, total, file):
+    print(f"profile: {total * 1000:.2f}ms total", file=file)
+    width = max(
+        [2 * span["depth"] + len(span["name"]) for span in spans],
+        default=0
+    )
+    for span in spans:
+        label = "  " * span["depth"] + span["name"]
+        print(
+            f"  {label:<{width}}  {span['seconds'] * 1000:9.2f}ms",
+            file=file
+        )
+
+
+def _append_report(spans, total, path):
+    import os
+    import json
+    with open(path, "a") as f:
+        f.write(json.dumps({
+            "time": time.time(),
+            "pid": os.getpid(),
+            "argv": sys.argv,
+            "total": total,
+            "spans": spans,
+        }) + "\n")
+
+
+def report():
+    global _spans, _started
+    if _spans is None:
+        return
+    spans = _spans
+    total = time.perf_counter() - _started
+    _spans = []
+    _started = time.perf_counter()
+    if _output == "-":
+        _print_report(spans, total, sys.stderr)
+    else:
+        _append_report(spans, total, _output)
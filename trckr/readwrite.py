@@ -1,21 +1,221 @@
 # SPDX-FileCopyrightText: 2022 Mattias Nyberg
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import os
 import json
+from contextlib import contextmanager
+from .profile import span
 
 
-class JsonFileRW:
+def file_state(path):
+    # Changes whenever the file is rewritten or replaced.
+    try:
+        stat = os.stat(path)
+        return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+
+def write_json_atomic(path, data):
+    # Readers see either the old or the new file, never a partial one.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class LockedFile:
+    # Writers serialize on an advisory lock on a sidecar file, the data
+    # file itself is swapped out by os.replace. The sidecar also holds a
+    # generation counter bumped on every write so a change is detected
+    # even when the file stat looks the same.
     def __init__(self, path):
         self._path = path
+        self._lock_path = f"{path}.lock"
+        self._lock_file = None
+        self._version = None
+
+    @contextmanager
+    def lock(self):
+        import fcntl
+        if self._lock_file is not None:
+            yield
+            return
+        with open(self._lock_path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._lock_file = f
+            try:
+                yield
+            finally:
+                self._lock_file = None
+
+    def _generation(self):
+        try:
+            with open(self._lock_path, "r") as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _current_version(self):
+        return [self._generation(), file_state(self._path)]
+
+    def version(self):
+        return self._current_version()
+
+    def changed(self):
+        return self._current_version() != self._version
+
+    def _mark_read(self):
+        # Taken before reading, a write in between shows up as a change
+        # at the next commit rather than going unnoticed.
+        self._version = self._current_version()
+
+    def _mark_written(self):
+        f = self._lock_file
+        f.seek(0)
+        generation = int(f.read() or 0) + 1
+        f.truncate(0)
+        f.write(str(generation))
+        f.flush()
+        self._version = self._current_version()
 
+    def _prepare(self, serialized):
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        mode = "wb" if isinstance(serialized, bytes) else "w"
+        with open(tmp_path, mode) as f:
+            f.write(serialized)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path
+
+    def _replace(self, serialized, only_unchanged):
+        tmp_path = self._prepare(serialized)
+        with self.lock():
+            if only_unchanged and self.changed():
+                os.unlink(tmp_path)
+                return False
+            os.replace(tmp_path, self._path)
+            self._mark_written()
+            return True
+
+
+class JsonFileRW(LockedFile):
     def read(self, default=None):
+        self._mark_read()
         try:
-            with open(self._path, "r") as f:
+            with span("read.json"), open(self._path, "r") as f:
                 return json.load(f)
         except FileNotFoundError:
             return default
 
+    def _serialize(self, data):
+        if "schema_version" in data:
+            # Versioned stores are compact and keep the key order of their
+            # schema, which streaming readers rely on.
+            return json.dumps(data, separators=(",", ":"))
+        return json.dumps(data, indent=4, sort_keys=True)
+
+    def stream(self, streamed=()):
+        from .jsonstream import JsonStream
+        try:
+            with open(self._path, "r") as f:
+                yield from JsonStream(f).items(streamed)
+        except FileNotFoundError:
+            return
+
     def write(self, data):
-        serialized = json.dumps(data, indent=4, sort_keys=True)
-        with open(self._path, "w") as f:
-            f.write(serialized)
+        with span("write.json"):
+            self._replace(self._serialize(data), only_unchanged=False)
+
+    def write_if_unchanged(self, data):
+        with span("write.json"):
+            return self._replace(self._serialize(data), only_unchanged=True)
+
+
+class JournalFileRW(LockedFile):
+    def read(self, default=None):
+        self._mark_read()
+        try:
+            with span("read.journal"), open(self._path, "r") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return default
+
+        records = []
+        for index, line in enumerate(lines):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn final line is what an interrupted append leaves
+                # behind, anything else is a corrupt journal.
+                if index < len(lines) - 1:
+                    raise
+        return records
+
+    def _serialize(self, records):
+        return "".join(
+            json.dumps(record, sort_keys=True) + "\n"
+            for record in records
+        )
+
+    def _drop_torn_tail(self, f, chunk_size=4096):
+        # Cuts a torn final line, which `read` skips anyway, so the next
+        # record starts on a line of its own.
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            f.seek(start)
+            chunk = f.read(position - start)
+            if position == end and chunk.endswith(b"\n"):
+                return
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            position = start
+        f.truncate(0)
+
+    def append_if_unchanged(self, records):
+        serialized = self._serialize(records).encode("utf-8")
+        with self.lock():
+            if self.changed():
+                return False
+            with open(self._path, "ab+") as f:
+                self._drop_torn_tail(f)
+                f.write(serialized)
+                f.flush()
+                os.fsync(f.fileno())
+            self._mark_written()
+            return True
+
+    def write(self, records):
+        self._replace(self._serialize(records), only_unchanged=False)
+
+    def write_if_unchanged(self, records):
+        return self._replace(self._serialize(records), only_unchanged=True)
+
+
+class BinaryFileRW(LockedFile):
+    # Entries are read and written as ColumnarEntries.
+    columnar = True
+
+    def read(self, default=None):
+        from .binary import loads
+        self._mark_read()
+        try:
+            with span("read.binary"), open(self._path, "rb") as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return default
+
+    def write(self, data):
+        from .binary import dumps
+        with span("write.binary"):
+            self._replace(dumps(data), only_unchanged=False)
+
+    def write_if_unchanged(self, data):
+        from .binary import dumps
+        with span("write.binary"):
+            return self._replace(dumps(data), only_unchanged=True)
@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from datetime import timedelta
+from .exceptions import TrckrError
+from .utils import hours_and_minutes
+
+
+# Time dimensions use the start of the (range clipped) entry, an entry
+# running past midnight counts towards the day it started.
+DIMENSIONS = {
+    "user": lambda entry: entry.meta.userid,
+    "context": lambda entry: entry.meta.contextid,
+    "note": lambda entry: entry.meta.note,
+    "day": lambda entry: str(entry.start.date()),
+    "week": lambda entry: "%04d-W%02d" % entry.start.isocalendar()[:2],
+    "month": lambda entry: entry.start.strftime("%Y-%m"),
+}
+
+SORT_ORDERS = ["key", "time"]
+
+
+def validate_dimensions(dimensions):
+    for dimension in dimensions:
+        if dimension not in DIMENSIONS:
+            raise TrckrError(
+                f"Unknown group by dimension: '{dimension}'"
+                f" (use {', '.join(DIMENSIONS.keys())})"
+            )
+
+
+def aggregate(entries, dimensions):
+    # One pass hash aggregation, returns {key tuple: [duration, count]}.
+    validate_dimensions(dimensions)
+    keys = [DIMENSIONS[dimension] for dimension in dimensions]
+    groups = {}
+    for entry in entries:
+        key = tuple(key(entry) for key in keys)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [entry.duration, 1]
+        else:
+            group[0] += entry.duration
+            group[1] += 1
+    return groups
+
+
+def merge_groups(groups, other):
+    for key, [duration, count] in other.items():
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [duration, count]
+        else:
+            group[0] += duration
+            group[1] += count
+    return groups
+
+
+def _sort_key(sort):
+    # None sorts first, e.g. entries without a note.
+    def _by_key(group):
+        return (group["id"] is not None, group["id"] or "")
+
+    if sort == "time":
+        return lambda group: (-group["duration"], _by_key(group))
+    return _by_key
+
+
+def _build(rows, depth, sort):
+    children = {}
+    for key, [duration, count] in rows:
+        children.setdefault(key[depth], []).append((key, [duration, count]))
+    groups = []
+    for id, child_rows in children.items():
+        group = {
+            "id": id,
+            "duration": sum(
+                (duration for _, [duration, _] in child_rows),
+                timedelta()
+            ),
+            "count": sum(count for _, [_, count] in child_rows),
+        }
+        if depth + 1 < len(child_rows[0][0]):
+            group["groups"] = _build(child_rows, depth + 1, sort)
+        groups.append(group)
+    return sorted(groups, key=_sort_key(sort))
+
+
+def build_report(groups, dimensions, sort="key"):
+    # Nests the aggregated groups by dimension with subtotals per level.
+    validate_dimensions(dimensions)
+    if sort not in SORT_ORDERS:
+        raise TrckrError(
+            f"Unknown sort order: '{sort}' (use {', '.join(SORT_ORDERS)})"
+        )
+    rows = list(groups.items())
+    return {
+        "group_by": list(dimensions),
+        "duration": sum(
+            (duration for _, [duration, _] in rows),
+            timedelta()
+        ),
+        "count": sum(count for _, [_, count] in rows),
+        "groups": _build(rows, 0, sort) if len(dimensions) > 0 else [],
+    }
+
+
+def format_report(report, timeformat="%02dh %02dm"):
+    # Plain data for json and yaml output, durations are formatted as time.
+    def _format(group):
+        return {
+            **{
+                key: value
+                for key, value in group.items()
+                if key not in ["duration", "groups"]
+            },
+            "time": timeformat % hours_and_minutes(group["duration"]),
+            "count": group["count"],
+            **(
+                {"groups": [_format(child) for child in group["groups"]]}
+                if "groups" in group
+                else {}
+            ),
+        }
+
+    return _format(report)
+
+
+def report_lines(report, timeformat="%02dh %02dm"):
+    # Flattened rows, one per group at every level, for line based output.
+    def _lines(groups, path):
+        for group in groups:
+            key = [*path, group["id"]]
+            yield {
+                "type": "group" if "groups" in group else "row",
+                "key": dict(zip(report["group_by"], key)),
+                "time": timeformat % hours_and_minutes(group["duration"]),
+                "count": group["count"],
+            }
+            yield from _lines(group.get("groups", []), key)
+
+    yield from _lines(report["groups"], [])
+    yield {
+        "type": "total",
+        "key": {},
+        "time": timeformat % hours_and_minutes(report["duration"]),
+        "count": report["count"],
+    }
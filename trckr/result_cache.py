@@ -0,0 +1,162 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import io
+import os
+import sys
+import json
+import zlib
+from contextlib import redirect_stdout
+from .config_cache import cache_dir
+from .readwrite import LockedFile, file_state, write_json_atomic
+from .utils import database_configs
+from .exceptions import TrckrError
+
+
+CACHE_VERSION = 1
+DEFAULT_RESULT_CACHE = os.environ.get("TRCKR_NO_RESULT_CACHE") != "1"
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+
+def store_version(dbconf):
+    # Every commit replaces the store file, or the shard manifest, and bumps
+    # the generation in its lock file. Sqlite commits land in the database
+    # or its write ahead log.
+    path = dbconf["path"]
+    if dbconf["type"] == "sqlite":
+        return [file_state(path), file_state(f"{path}-wal")]
+    if dbconf.get("shards") is not None:
+        path = os.path.join(path, "manifest.json")
+    return LockedFile(path).version()
+
+
+def cache_key(config, command):
+    # None when the stores can not be identified, the query then runs
+    # uncached and reports the config problem itself.
+    try:
+        dbconfs = (
+            database_configs(config)
+            if command.get("all_dbs", False)
+            else [config["database"]]
+        )
+        stores = [
+            [dbconf, store_version(dbconf)]
+            for dbconf in dbconfs
+        ]
+    except (KeyError, TypeError, TrckrError):
+        return None
+    return json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "stores": stores,
+            "command": command,
+        },
+        sort_keys=True,
+        default=str
+    )
+
+
+def _max_size():
+    # A malformed size only affects caching, not the command.
+    try:
+        return int(
+            os.environ.get("TRCKR_RESULT_CACHE_SIZE", DEFAULT_MAX_SIZE)
+        )
+    except ValueError:
+        return DEFAULT_MAX_SIZE
+
+
+def _cache_path(key):
+    digest = zlib.crc32(key.encode("utf-8"))
+    return os.path.join(cache_dir(), f"list-{digest:08x}.json")
+
+
+def _read_cache(path, key):
+    try:
+        with open(path, "r") as f:
+            cached = json.load(f)
+        if cached["key"] != key:
+            return None
+        # The modification time orders entries for eviction.
+        os.utime(path)
+        return cached["output"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _evict(max_size):
+    try:
+        entries = []
+        with os.scandir(cache_dir()) as scan:
+            for entry in scan:
+                if entry.name.startswith("list-"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry in sorted(entries, key=lambda e: e[0]):
+            if size <= max_size:
+                break
+            os.unlink(entry.path)
+            size -= entry_size
+    except OSError:
+        pass
+
+
+def _write_cache(path, data, max_size):
+    try:
+        write_json_atomic(path, data)
+    except OSError:
+        return
+    _evict(max_size)
+
+
+class _Tee(io.TextIOBase):
+    # Passes output through while keeping a copy, up to `limit` characters.
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self._limit = limit
+        self._parts = []
+        self._size = 0
+        self.complete = True
+
+    def write(self, text):
+        self._size += len(text)
+        if self._size <= self._limit:
+            self._parts.append(text)
+        try:
+            return self._stream.write(text)
+        except BrokenPipeError:
+            self.complete = False
+            raise
+
+    def flush(self):
+        self._stream.flush()
+
+    def fileno(self):
+        return self._stream.fileno()
+
+    def getvalue(self):
+        return "".join(self._parts)
+
+    def cacheable(self):
+        return self.complete and self._size <= self._limit
+
+
+def cached_output(key, render, max_size=None):
+    # Replays the output of an earlier render with the same key. Outputs
+    # larger than a quarter of the cache are passed through uncached.
+    if key is None:
+        render()
+        return
+    if max_size is None:
+        max_size = _max_size()
+    path = _cache_path(key)
+    output = _read_cache(path, key)
+    if output is not None:
+        sys.stdout.write(output)
+        return
+    tee = _Tee(sys.stdout, max_size // 4)
+    with redirect_stdout(tee):
+        render()
+    if tee.cacheable():
+        _write_cache(path, {"key": key, "output": tee.getvalue()}, max_size)
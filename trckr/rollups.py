@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from datetime import date, datetime, time, timedelta
+
+
+MICROSECOND = timedelta(microseconds=1)
+
+
+def midnight(day: date) -> datetime:
+    return datetime.combine(day, time())
+
+
+class Rollups:
+    def __init__(self, days=None, count=0):
+        self._days = {} if days is None else days
+        self.count = count
+
+    def add(self, start: datetime, stop: datetime, userid, contextid):
+        self.count += 1
+        cursor = start
+        while cursor < stop:
+            piece_stop = min(stop, midnight(cursor.date() + timedelta(days=1)))
+            users = self._days.setdefault(str(cursor.date()), {})
+            contexts = users.setdefault(userid, {})
+            contexts[contextid] = (
+                contexts.get(contextid, 0)
+                + (piece_stop - cursor) // MICROSECOND
+            )
+            cursor = piece_stop
+
+    def _days_in(self, first_day: date = None, last_day: date = None):
+        if first_day is None or last_day is None:
+            first = None if first_day is None else str(first_day)
+            last = None if last_day is None else str(last_day)
+            return (
+                users
+                for day, users in self._days.items()
+                if (first is None or day >= first)
+                and (last is None or day <= last)
+            )
+        return (
+            self._days[str(first_day + timedelta(days=offset))]
+            for offset in range((last_day - first_day).days + 1)
+            if str(first_day + timedelta(days=offset)) in self._days
+        )
+
+    def totals(self, first_day: date = None, last_day: date = None):
+        totals = {}
+        for users in self._days_in(first_day, last_day):
+            for userid, contexts in users.items():
+                for contextid, micros in contexts.items():
+                    key = (userid, contextid)
+                    totals[key] = totals.get(key, 0) + micros
+        return {
+            key: timedelta(microseconds=micros)
+            for key, micros in totals.items()
+        }
+
+    def to_data(self):
+        return {
+            "count": self.count,
+            "days": self._days
+        }
+
+    @staticmethod
+    def from_data(data):
+        return Rollups(days=data["days"], count=data["count"])
+
+    @staticmethod
+    def from_entries(entries):
+        rollups = Rollups()
+        for entry in entries:
+            rollups.add(
+                entry.start,
+                entry.stop,
+                entry.meta.userid,
+                entry.meta.contextid
+            )
+        return rollups
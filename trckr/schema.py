@@ -0,0 +1,129 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from array import array
+from .columnar import ColumnarEntries, StringColumn, from_micros
+from .exceptions import TrckrError
+
+
+# Version 1 stores, without a schema_version, keep every entry as a dict
+# with str(datetime) times and its own meta. Version 2 keeps the entries in
+# start order as rows of
+#
+#   [start, stop, userid, contextid, note, id]
+#
+# with times in epoch microseconds and the meta fields as indexes into the
+# shared "userids", "contextids" and "notes" tables. The tables and every
+# other top level key are written before the entries so a streaming reader
+# has them when the rows arrive. The timer stays a version 1 entry dict.
+SCHEMA_VERSION = 2
+TABLES = ["userids", "contextids", "notes"]
+
+
+def schema_version(data) -> int:
+    return data.get("schema_version", 1)
+
+
+def encode(data):
+    entries = data.get("entries", [])
+    if not isinstance(entries, ColumnarEntries):
+        entries = ColumnarEntries(entries)
+    [starts, stops, ids, userids, contextids, notes] = entries.columns()
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "chronological": True,
+        **{
+            key: value
+            for key, value in data.items()
+            if key not in ["entries", "chronological"]
+        },
+        "userids": userids.values,
+        "contextids": contextids.values,
+        "notes": notes.values,
+        "entries": [
+            list(row)
+            for row in zip(
+                starts,
+                stops,
+                userids.codes,
+                contextids.codes,
+                notes.codes,
+                ids
+            )
+        ],
+    }
+
+
+def _check(data):
+    version = schema_version(data)
+    if version != SCHEMA_VERSION:
+        raise TrckrError(f"Unsupported database schema version: {version}")
+
+
+def decode_meta(data):
+    # Resolves the table codes of a row to a shared meta dict.
+    [userids, contextids, notes] = [data[table] for table in TABLES]
+    metas = {}
+
+    def _meta(userid, contextid, note):
+        key = (userid, contextid, note)
+        meta = metas.get(key)
+        if meta is None:
+            meta = metas[key] = {
+                "userid": userids[userid],
+                "contextid": contextids[contextid],
+                "note": notes[note],
+            }
+        return meta
+
+    return _meta
+
+
+def _rest(data):
+    return {
+        key: value
+        for key, value in data.items()
+        if key not in ["schema_version", "entries", *TABLES]
+    }
+
+
+def decode(data):
+    # Version 1 data with entry dicts, for stores that keep dicts in memory.
+    _check(data)
+    meta = decode_meta(data)
+    return {
+        **_rest(data),
+        "entries": [
+            {
+                "id": id,
+                "start": str(from_micros(start)),
+                "stop": str(from_micros(stop)),
+                "meta": meta(userid, contextid, note),
+            }
+            for [start, stop, userid, contextid, note, id] in data["entries"]
+        ]
+    }
+
+
+def decode_columnar(data):
+    # Builds the columns straight from the rows, no times are formatted or
+    # parsed.
+    _check(data)
+    rows = data["entries"]
+    [starts, stops, userids, contextids, notes, ids] = (
+        zip(*rows) if len(rows) > 0 else [()] * 6
+    )
+    return {
+        **_rest(data),
+        "entries": ColumnarEntries.from_columns(
+            starts=array("q", starts),
+            stops=array("q", stops),
+            ids=list(ids),
+            userids=StringColumn(data["userids"], array("I", userids)),
+            contextids=StringColumn(
+                data["contextids"],
+                array("I", contextids)
+            ),
+            notes=StringColumn(data["notes"], array("I", notes)),
+        )
+    }
@@ -0,0 +1,176 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+from typing import Iterable
+from datetime import datetime, timedelta
+from .readwrite import JsonFileRW
+from .database import OpLogDatabase, StructDatabase, Entry
+from .exceptions import TrckrError
+
+
+# Shard keys sort in time order and parse back to the start of their period.
+PERIODS = {
+    "year": "%Y",
+    "month": "%Y-%m",
+    "day": "%Y-%m-%d",
+}
+
+
+class ShardedStructDatabase(OpLogDatabase):
+    # Entries are stored in the shard of the period their start falls in,
+    # however far past the end of the period they run. The manifest keeps
+    # the latest stop of every shard so range queries can skip shards that
+    # ended before the range, and holds the running timer.
+    def __init__(
+        self,
+        path,
+        period="month",
+        shard_type=StructDatabase,
+        rollups=False,
+        schema_version=None
+    ):
+        if period not in PERIODS:
+            raise TrckrError(f"Unknown shard period: {period}")
+        self._path = path
+        self._period = period
+        self._shard_type = shard_type
+        self._rollups = rollups
+        self._schema_version = schema_version
+        self._manifest_rw = JsonFileRW(os.path.join(path, "manifest.json"))
+        self._pending = []
+        self._reset()
+
+    def _reset(self):
+        self._manifest = self._manifest_rw.read(None) or {
+            "period": self._period,
+            "timer": None,
+            "shards": {},
+        }
+        self._shards = {}
+        self._dirty = set()
+
+    def _format(self):
+        return PERIODS[self._manifest["period"]]
+
+    def _shard(self, key):
+        if key not in self._shards:
+            self._shards[key] = self._shard_type(
+                JsonFileRW(os.path.join(self._path, f"{key}.json")),
+                rollups=self._rollups,
+                schema_version=self._schema_version
+            )
+        return self._shards[key]
+
+    def _append_entry(self, entry):
+        start = datetime.fromisoformat(entry["start"])
+        stop = datetime.fromisoformat(entry["stop"])
+        key = start.strftime(self._format())
+        self._shard(key)._record({"op": "add", "entry": entry})
+        self._dirty.add(key)
+        shards = self._manifest["shards"]
+        stats = shards.get(key, {"count": 0, "max_stop": entry["stop"]})
+        shards[key] = {
+            "count": stats["count"] + 1,
+            "max_stop": str(
+                max(stop, datetime.fromisoformat(stats["max_stop"]))
+            ),
+        }
+
+    def _set_timer(self, timer):
+        self._manifest["timer"] = timer
+
+    def commit(self):
+        # The manifest lock serializes writers of the whole store, so the
+        # shards written under it always belong to the manifest written.
+        os.makedirs(self._path, exist_ok=True)
+        with self._manifest_rw.lock():
+            if self._manifest_rw.changed():
+                self._rebase()
+            for key in sorted(self._dirty):
+                self._shard(key).commit()
+            self._manifest_rw.write(self._manifest)
+        self._pending = []
+        self._dirty = set()
+
+    def _overlapping_shards(self, from_time=None, to_time=None):
+        for key, stats in sorted(self._manifest["shards"].items()):
+            if (
+                to_time is not None
+                and datetime.strptime(key, self._format()) >= to_time
+            ):
+                break
+            if (
+                from_time is not None
+                and datetime.fromisoformat(stats["max_stop"]) <= from_time
+            ):
+                continue
+            yield self._shard(key)
+
+    def select(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> Iterable[Entry]:
+        for shard in self._overlapping_shards(from_time, to_time):
+            yield from shard.select(
+                from_time,
+                to_time,
+                userid=userid,
+                contextid=contextid,
+                note_prefix=note_prefix
+            )
+
+    def totals(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        **filters
+    ) -> dict[tuple[str, str], timedelta]:
+        totals = {}
+        for shard in self._overlapping_shards(from_time, to_time):
+            shard_totals = shard.totals(from_time, to_time, **filters)
+            for key, time in shard_totals.items():
+                totals[key] = totals.get(key, timedelta()) + time
+        return totals
+
+    def aggregate(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        dimensions: list[str] = (),
+        **filters
+    ) -> dict[tuple, list]:
+        from .report import merge_groups
+        groups = {}
+        for shard in self._overlapping_shards(from_time, to_time):
+            merge_groups(
+                groups,
+                shard.aggregate(from_time, to_time, dimensions, **filters)
+            )
+        return groups
+
+    @property
+    def entries(self) -> list[Entry]:
+        return [
+            entry
+            for shard in self._overlapping_shards()
+            for entry in shard.entries
+        ]
+
+    @property
+    def timer(self):
+        return self._manifest["timer"]
+
+    def is_empty(self):
+        return (
+            len(self._manifest["shards"]) == 0
+            and self._manifest["timer"] is None
+        )
+
+    def _migration_lock(self):
+        os.makedirs(self._path, exist_ok=True)
+        return self._manifest_rw.lock()
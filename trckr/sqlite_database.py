@@ -0,0 +1,212 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import uuid
+import sqlite3
+from typing import Iterable
+from datetime import datetime
+from .database import DatabaseInterface, Entry, Meta
+from .exceptions import TrckrError
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    start TEXT NOT NULL,
+    stop TEXT NOT NULL,
+    userid TEXT,
+    contextid TEXT,
+    note TEXT
+);
+CREATE TABLE IF NOT EXISTS timer (
+    id TEXT PRIMARY KEY,
+    start TEXT NOT NULL,
+    userid TEXT,
+    contextid TEXT,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_start ON entries (start);
+CREATE INDEX IF NOT EXISTS entries_stop ON entries (stop);
+CREATE INDEX IF NOT EXISTS entries_contextid ON entries (contextid);
+CREATE INDEX IF NOT EXISTS entries_userid ON entries (userid);
+"""
+
+
+def _entry_from_row(row):
+    [id, start, stop, userid, contextid, note] = row
+    return Entry(
+        start=datetime.fromisoformat(start),
+        stop=datetime.fromisoformat(stop),
+        meta=Meta(userid=userid, contextid=contextid, note=note),
+        id=id
+    )
+
+
+class SqliteDatabase(DatabaseInterface):
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(SCHEMA)
+
+    def _generate_id(self):
+        return str(uuid.uuid4())
+
+    def _insert_entry(self, id, start, stop, meta: Meta):
+        self._connection.execute(
+            "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (id, start, stop, meta.userid, meta.contextid, meta.note)
+        )
+
+    def _timer(self):
+        return self._connection.execute(
+            "SELECT id, start, userid, contextid, note FROM timer"
+        ).fetchone()
+
+    def _stop(self, time: datetime):
+        timer = self._timer()
+        if timer is not None:
+            [id, start, userid, contextid, note] = timer
+            self._insert_entry(
+                id,
+                start,
+                str(time),
+                Meta(userid=userid, contextid=contextid, note=note)
+            )
+            self._connection.execute("DELETE FROM timer")
+
+    def start(self, time: datetime, meta: Meta = None):
+        self._stop(time)
+        self._connection.execute(
+            "INSERT INTO timer VALUES (?, ?, ?, ?, ?)",
+            (
+                self._generate_id(),
+                str(time),
+                meta.userid,
+                meta.contextid,
+                meta.note
+            )
+        )
+
+    def stop(self, time: datetime):
+        if self._timer() is not None:
+            self._stop(time)
+        else:
+            raise TrckrError("No existing timer to stop.")
+
+    def add(self, start: datetime, stop: datetime, meta: Meta = None):
+        self._insert_entry(self._generate_id(), str(start), str(stop), meta)
+
+    def add_many(self, entries) -> int:
+        count = 0
+
+        def _rows():
+            nonlocal count
+            for start, stop, meta in entries:
+                count += 1
+                yield (
+                    self._generate_id(),
+                    str(start),
+                    str(stop),
+                    meta.userid,
+                    meta.contextid,
+                    meta.note
+                )
+
+        self._connection.executemany(
+            "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            _rows()
+        )
+        return count
+
+    def commit(self):
+        self._connection.commit()
+
+    def select(
+        self,
+        from_time: datetime = None,
+        to_time: datetime = None,
+        userid: str = None,
+        contextid: str = None,
+        note_prefix: str = None
+    ) -> Iterable[Entry]:
+        conditions = []
+        params = []
+        if from_time is not None:
+            conditions.append("stop > ?")
+            params.append(str(from_time))
+        if to_time is not None:
+            conditions.append("start < ?")
+            params.append(str(to_time))
+        if userid is not None:
+            conditions.append("userid = ?")
+            params.append(userid)
+        if contextid is not None:
+            conditions.append("contextid = ?")
+            params.append(contextid)
+        if note_prefix is not None:
+            conditions.append("substr(note, 1, ?) = ?")
+            params.extend([len(note_prefix), note_prefix])
+        where = (
+            f"WHERE {' AND '.join(conditions)}"
+            if len(conditions) > 0
+            else ""
+        )
+        rows = self._connection.execute(
+            "SELECT id, start, stop, userid, contextid, note FROM entries "
+            f"{where} ORDER BY start",
+            params
+        )
+        entries = (
+            _entry_from_row(row).intersection(from_time, to_time)
+            for row in rows
+        )
+        return (
+            entry
+            for entry in entries
+            if entry is not None
+        )
+
+    @property
+    def entries(self) -> list[Entry]:
+        return list(self.select())
+
+    @property
+    def timer(self):
+        timer = self._timer()
+        if timer is None:
+            return None
+        [id, start, userid, contextid, note] = timer
+        return {
+            "id": id,
+            "start": start,
+            "stop": str(None),
+            "meta": {"userid": userid, "contextid": contextid, "note": note}
+        }
+
+    def is_empty(self):
+        [count] = self._connection.execute(
+            "SELECT (SELECT COUNT(*) FROM entries)"
+            " + (SELECT COUNT(*) FROM timer)"
+        ).fetchone()
+        return count == 0
+
+    def migrate(self, source):
+        for entry in source.entries:
+            self._insert_entry(
+                entry.id,
+                str(entry.start),
+                str(entry.stop),
+                entry.meta
+            )
+        timer = source.timer
+        if timer is not None:
+            self._connection.execute(
+                "INSERT INTO timer VALUES (?, ?, ?, ?, ?)",
+                (
+                    timer["id"],
+                    timer["start"],
+                    timer["meta"]["userid"],
+                    timer["meta"]["contextid"],
+                    timer["meta"]["note"]
+                )
+            )
+        self.commit()
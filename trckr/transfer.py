@@ -0,0 +1,128 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+from datetime import datetime
+from .database import Meta
+from .exceptions import TrckrError
+
+
+class RowError(Exception):
+    pass
+
+
+def read_csv_rows(f):
+    import csv
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl_rows(f):
+    for line_number, line in enumerate(f, start=1):
+        if line.strip() == "":
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, RowError(f"invalid json: {e.msg}")
+            continue
+        if not isinstance(row, dict):
+            yield line_number, RowError("row is not an object")
+            continue
+        meta = row.pop("meta", {})
+        if not isinstance(meta, dict):
+            yield line_number, RowError("meta is not an object")
+            continue
+        yield line_number, {**meta, **row}
+
+
+row_readers = {
+    "csv": read_csv_rows,
+    "jsonl": read_jsonl_rows,
+}
+
+
+def _parse_row_time(row, key):
+    value = row.get(key)
+    if not isinstance(value, str) or value == "":
+        raise RowError(f"missing {key}")
+    try:
+        time = datetime.fromisoformat(value)
+    except ValueError:
+        raise RowError(f"invalid {key}: {value!r}")
+    if time.tzinfo is not None:
+        # Entries are stored in naive local time.
+        time = time.astimezone().replace(tzinfo=None)
+    return time
+
+
+def validate_row(row, defaults):
+    if isinstance(row, RowError):
+        raise row
+    start = _parse_row_time(row, "start")
+    stop = _parse_row_time(row, "stop")
+    if stop <= start:
+        raise RowError("stop is not after start")
+    try:
+        meta = Meta.from_data({
+            **defaults,
+            **{
+                key: row[key]
+                for key in ["userid", "contextid", "note"]
+                if row.get(key) not in (None, "")
+            }
+        })
+    except KeyError as e:
+        raise RowError(f"missing {e.args[0]}")
+    if not all(
+        isinstance(value, str)
+        for value in [meta.userid, meta.contextid, meta.note]
+    ):
+        raise RowError("userid, contextid and note must be strings")
+    return start, stop, meta
+
+
+def read_entries(f, format, defaults, rejected):
+    try:
+        rows = row_readers[format](f)
+    except KeyError:
+        raise TrckrError(f"Unknown import format: {format}")
+    for line_number, row in rows:
+        try:
+            yield validate_row(row, defaults)
+        except RowError as e:
+            rejected.append((line_number, str(e)))
+
+
+FIELDS = ["id", "start", "stop", "userid", "contextid", "note"]
+
+
+def entry_row(entry):
+    return [
+        entry.id,
+        str(entry.start),
+        str(entry.stop),
+        entry.meta.userid,
+        entry.meta.contextid,
+        entry.meta.note,
+    ]
+
+
+def write_csv_rows(f, entries):
+    import csv
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    for entry in entries:
+        writer.writerow(entry_row(entry))
+
+
+def write_jsonl_rows(f, entries):
+    for entry in entries:
+        f.write(json.dumps(dict(zip(FIELDS, entry_row(entry)))) + "\n")
+
+
+entry_writers = {
+    "csv": write_csv_rows,
+    "jsonl": write_jsonl_rows,
+}
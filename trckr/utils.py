@@ -1,10 +1,16 @@
 # SPDX-FileCopyrightText: 2022 Mattias Nyberg
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import os
 import json
 from contextlib import contextmanager
-from .readwrite import JsonFileRW
-from .database import StructDatabase
+from .readwrite import JsonFileRW, JournalFileRW, BinaryFileRW
+from .database import (
+    StructDatabase,
+    ColumnarStructDatabase,
+    JournalDatabase,
+    StreamingStructDatabase,
+)
 from .exceptions import TrckrError
 
 
@@ -15,6 +21,13 @@ def default_config():
             "path": "{HOME}/.trckr-{GITNAME}",
             "type": "struct",
         },
+        "databases": [
+            {
+                "data_type": "json",
+                "path": "{HOME}/.trckr-*",
+                "type": "struct",
+            }
+        ],
         "defaults": {
             "contextid": "{GITNAME}",
             "userid": "{USER}",
@@ -25,7 +38,7 @@ def default_config():
 
 def parse_path(path_template, data):
     try:
-        return path_template.format(**data)
+        return path_template.format_map(data)
     except (ValueError, KeyError) as e:
         raise TrckrError(
             f"Failed to parse path template: {str(e)}: in '{path_template}'"
@@ -46,14 +59,135 @@ def struct_database(config):
             path = dbconf["path"]
             data_type = dbconf["data_type"]
             if data_type == "json":
-                return StructDatabase(
+                # Version 2 rows load straight into columns, decoding them
+                # into entry dicts would cost more than the smaller file
+                # saves.
+                memory = dbconf.get(
+                    "memory",
+                    "columnar"
+                    if dbconf.get("schema_version") == 2
+                    else "dict"
+                )
+                database = (
+                    ColumnarStructDatabase
+                    if memory == "columnar"
+                    else StructDatabase
+                )
+                if dbconf.get("shards") is not None:
+                    return sharded_database(dbconf, database)
+                return database(
                     rw=JsonFileRW(path),
+                    rollups=dbconf.get("rollups", False),
+                    schema_version=dbconf.get("schema_version"),
+                )
+            elif data_type == "binary":
+                return _migrate(
+                    ColumnarStructDatabase(
+                        rw=BinaryFileRW(path),
+                        rollups=dbconf.get("rollups", False),
+                    ),
+                    dbconf
                 )
+            elif data_type == "journal":
+                return JournalDatabase(
+                    rw=JournalFileRW(path),
+                    compact_after=dbconf.get("compact_after", 1000),
+                    rollups=dbconf.get("rollups", False),
+                    schema_version=dbconf.get("schema_version"),
+                )
+    except KeyError:
+        pass
+    return None
+
+
+def _migrate(db, dbconf):
+    migrate_from = dbconf.get("migrate_from")
+    if migrate_from is not None and db.is_empty():
+        data_type = dbconf.get("migrate_data_type", "json")
+        source = struct_database({
+            "database": {
+                "type": "struct",
+                "path": migrate_from,
+                "data_type": data_type,
+            }
+        })
+        if source is None:
+            raise TrckrError(f"Unsupported migrate_data_type: {data_type!r}")
+        db.migrate(source)
+    return db
+
+
+def sharded_database(dbconf, shard_type):
+    from .sharded_database import ShardedStructDatabase
+    return _migrate(
+        ShardedStructDatabase(
+            dbconf["path"],
+            period=dbconf["shards"],
+            shard_type=shard_type,
+            rollups=dbconf.get("rollups", False),
+            schema_version=dbconf.get("schema_version"),
+        ),
+        dbconf
+    )
+
+
+def sqlite_database(config):
+    try:
+        dbconf = config["database"]
+        if dbconf["type"] == "sqlite":
+            from .sqlite_database import SqliteDatabase
+            return _migrate(SqliteDatabase(dbconf["path"]), dbconf)
+    except KeyError:
+        pass
+    return None
+
+
+def streaming_struct_database(config):
+    try:
+        dbconf = config["database"]
+        if (
+            dbconf["type"] == "struct"
+            and dbconf["data_type"] == "json"
+            and dbconf.get("shards") is None
+            and not dbconf.get("rollups", False)
+        ):
+            return StreamingStructDatabase(JsonFileRW(dbconf["path"]))
     except KeyError:
         pass
     return None
 
 
+def database_configs(config):
+    import glob
+    dbconfs = config.get("databases")
+    if dbconfs is None:
+        raise TrckrError(
+            "No databases configured, add a \"databases\" list to the config."
+        )
+    seen = set()
+    expanded = []
+    for dbconf in dbconfs:
+        path = dbconf["path"]
+        # Sharded stores are directories, every other store is one file.
+        is_store = (
+            os.path.isdir
+            if dbconf.get("shards") is not None
+            else os.path.isfile
+        )
+        paths = sorted(glob.glob(path)) or [path]
+        for match in paths:
+            # Skip the lock and temporary files written next to stores.
+            if match.endswith((".lock", ".tmp")) or (
+                match != path and not is_store(match)
+            ):
+                continue
+            key = os.path.realpath(match)
+            if key not in seen:
+                seen.add(key)
+                expanded.append({**dbconf, "path": match})
+    return expanded
+
+
 def first_database(loaders):
     def _loader(config):
         dbs = (loader(config) for loader in loaders)
@@ -84,12 +218,29 @@ def config_from_json(path, extensions=None):
         for key, value in data.get("defaults", {}).items()
     }
 
+    def _parse_database(dbconf):
+        return {
+            key: (
+                parse_path(value, ext_data)
+                if isinstance(value, str)
+                else value
+            )
+            for key, value in dbconf.items()
+        }
+
     return {
         **data,
-        "database": {
-            **data["database"],
-            "path": parse_path(data["database"]["path"], ext_data),
-        },
+        "database": _parse_database(data["database"]),
+        **(
+            {
+                "databases": [
+                    _parse_database(dbconf)
+                    for dbconf in data["databases"]
+                ]
+            }
+            if "databases" in data
+            else {}
+        ),
         "defaults": defaults
     }
 
@@ -131,5 +282,13 @@ def writable_config(path):
 
 
 database_loaders = [
-    struct_database
+    struct_database,
+    sqlite_database,
+]
+
+# Used for commands that only read, json stores are streamed instead of
+# loaded.
+reader_loaders = [
+    streaming_struct_database,
+    *database_loaders,
 ]
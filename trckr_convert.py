@@ -0,0 +1,29 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+from argparse import ArgumentParser
+from trckr import binary
+from trckr.exceptions import TrckrError
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Convert a struct database between json and binary."
+    )
+    parser.add_argument(
+        "direction",
+        choices=["to-binary", "to-json"],
+        help="to-binary reads json and writes binary, to-json the reverse"
+    )
+    parser.add_argument("source", type=str)
+    parser.add_argument("destination", type=str)
+    args = parser.parse_args(sys.argv[1:])
+    converters = {
+        "to-binary": binary.json_to_binary,
+        "to-json": binary.binary_to_json,
+    }
+    try:
+        converters[args.direction](args.source, args.destination)
+    except TrckrError as e:
+        print(str(e))
@@ -0,0 +1,34 @@
+# SPDX-FileCopyrightText: 2022 Mattias Nyberg
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+from argparse import ArgumentParser
+from trckr import daemon
+from trckr.exceptions import TrckrError
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Trckr daemon serving track and st over a unix socket."
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        dest="socket_path",
+        default=daemon.default_socket_path(),
+        help="path to the unix socket"
+    )
+    parser.add_argument(
+        "--commit-interval",
+        type=float,
+        default=1.0,
+        help="seconds between group commits"
+    )
+    args = parser.parse_args(sys.argv[1:])
+    try:
+        daemon.serve(
+            socket_path=args.socket_path,
+            commit_interval=args.commit_interval
+        )
+    except TrckrError as e:
+        print(str(e))